@@ -0,0 +1,185 @@
+"""
+Runs a rule headlessly and streams one JSON summary per generation
+(population, births, deaths and bounding box) to stdout, optionally dumping
+the live cells every so many generations. Nothing is kept between
+generations beyond the grid itself, so memory stays flat however long it runs.
+
+    python batch.py Conway --pattern Methuselas:0 --size 400 400 -n 1000000
+    python batch.py "Staggered Seeds" --density .2 --dump-every 500 --dump-dir dumps
+    python batch.py B36/S23 --density .3 -n 500
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import random
+import sys
+import numpy as np
+from data.components.grid import AutomataGrid
+from data.components.rules import is_staggered
+from data.components.seeds import PATTERNS
+
+
+def make_grid(rule, columns, rows, infinite=False, engine=None):
+    """Make a grid of columns x rows cells. Cells are one pixel; nothing is drawn."""
+    return AutomataGrid(columns, rows, 1, rule, staggered=is_staggered(rule),
+                                infinite=infinite, engine=engine)
+
+
+def pattern_rule(grid):
+    """
+    Return the name seeds.PATTERNS lists grid's rule under, matching rule
+    strings to the named rule that compiles to the same Rule. The patterns
+    are drawn for the square lattice, so staggered grids have none.
+    """
+    for name in PATTERNS:
+        if AutomataGrid.compile_rule(name) == grid.rule:
+            return name
+    return None
+
+
+def seed_pattern(grid, rule, pattern):
+    """
+    Place a pattern from seeds.PATTERNS, given as "Category:number" (for
+    example "Spaceships:1"), in the middle of the grid.
+    """
+    category, _, number = pattern.partition(":")
+    try:
+        charmap = PATTERNS[pattern_rule(grid)][category][int(number or 0)]
+    except (KeyError, IndexError, ValueError):
+        raise ValueError("No pattern {!r} for {}".format(pattern, rule))
+    left = (grid.columns - len(charmap[0])) // 2
+    top = (grid.rows - len(charmap)) // 2
+    grid.set_cells(((left + x, top + y), True)
+                       for y, row in enumerate(charmap)
+                       for x, char in enumerate(row) if char == "X")
+
+
+def seed_random(grid, density, seed=None):
+    rng = random.Random(seed)
+    grid.set_cells((index, True) for index in grid.indices() if rng.random() < density)
+
+
+def live_indices(grid):
+    """Return arrays of the columns and rows of every live cell."""
+    if hasattr(grid.engine, "cell_array"):
+        return np.nonzero(grid.engine.cell_array())
+    live = [index for index, _ in grid.live_cells()]
+    if not live:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return tuple(np.array(axis) for axis in zip(*live))
+
+
+def summarize(generation, columns, rows, births, deaths):
+    bbox = None
+    if len(columns):
+        bbox = [int(columns.min()), int(rows.min()), int(columns.max()), int(rows.max())]
+    return {"generation": generation, "population": len(columns),
+               "births": births, "deaths": deaths, "bbox": bbox}
+
+
+def run(grid, generations):
+    """
+    Step grid generations times, yielding a summary dict for the starting
+    state and after every step. Births and deaths come from the engine's
+    change list; engines that can't report changes fall back to diffing the
+    live sets of consecutive generations.
+    """
+    columns, rows = live_indices(grid)
+    population = len(columns)
+    yield summarize(grid.generation, columns, rows, 0, 0)
+    previous = set(zip(columns.tolist(), rows.tolist()))
+    for _ in range(generations):
+        grid.update()
+        columns, rows = live_indices(grid)
+        changed = grid.engine.changes()
+        if changed is None:
+            live = set(zip(columns.tolist(), rows.tolist()))
+            births, deaths = len(live - previous), len(previous - live)
+            previous = live
+        else:
+            previous = None
+            flipped = len(changed)
+            births = (flipped + len(columns) - population) // 2
+            deaths = flipped - births
+        population = len(columns)
+        yield summarize(grid.generation, columns, rows, births, deaths)
+
+
+def dump(grid, directory):
+    """Write the live cells as "column row" lines to directory/generation-N.cells."""
+    path = os.path.join(directory, "generation-{}.cells".format(grid.generation))
+    columns, rows = live_indices(grid)
+    with open(path, "w") as f:
+        f.write("# {} generation {}\n".format(grid.sim_name, grid.generation))
+        for column, row in zip(columns.tolist(), rows.tolist()):
+            f.write("{} {}\n".format(column, row))
+    return path
+
+
+def rule_argument(text):
+    """Accept a named rule or any rule string the grid can compile."""
+    try:
+        AutomataGrid.compile_rule(text, is_staggered(text))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("rule", type=rule_argument,
+                                  help="one of {} or a B/S rule string such as B36/S23 "
+                                         "(B2/S34H for the staggered lattice)".format(
+                                         ", ".join(sorted(AutomataGrid.rules))))
+    parser.add_argument("--pattern", help='a seeds.PATTERNS entry as "Category:number"; '
+                                                       'a random soup is used if not given')
+    parser.add_argument("--density", type=float, default=.35, help="random soup density")
+    parser.add_argument("--seed", type=int, help="random soup seed")
+    parser.add_argument("--size", nargs=2, type=int, default=(200, 200),
+                                  metavar=("COLUMNS", "ROWS"))
+    parser.add_argument("-n", "--generations", type=int, default=1000)
+    parser.add_argument("--infinite", action="store_true",
+                                  help="let patterns grow past the board (sparse engine)")
+    parser.add_argument("--engine", choices=sorted(AutomataGrid.engines))
+    parser.add_argument("--every", type=int, default=1, help="print every Nth summary")
+    parser.add_argument("--dump-every", type=int, default=0)
+    parser.add_argument("--dump-dir", default=".")
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    options = parser.parse_args(argv)
+    columns, rows = options.size
+    try:
+        grid = make_grid(options.rule, columns, rows, options.infinite, options.engine)
+        if options.infinite and not grid.infinite:
+            parser.error("--infinite can't be used with {}, which only runs on a bounded "
+                             "board".format(options.rule))
+        if options.pattern:
+            seed_pattern(grid, options.rule, options.pattern)
+        else:
+            seed_random(grid, options.density, options.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    if options.dump_every and not os.path.isdir(options.dump_dir):
+        os.makedirs(options.dump_dir)
+    out = sys.stdout
+    for summary in run(grid, options.generations):
+        generation = summary["generation"]
+        if generation % options.every == 0:
+            out.write(json.dumps(summary) + "\n")
+        if options.dump_every and generation % options.dump_every == 0:
+            dump(grid, options.dump_dir)
+    out.flush()
+    close = getattr(grid.engine, "close", None)
+    if close is not None:
+        close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
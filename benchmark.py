@@ -0,0 +1,167 @@
+"""
+Headless benchmarks for AutomataGrid. Times update and draw (to an
+off-screen Surface) for every rule across engines, board sizes, seed
+densities and draw modes, with the Lines connection phase timed on its own.
+Results are written as JSON and compared against a stored baseline.
+
+    python benchmark.py --save-baseline
+    python benchmark.py --baseline benchmark-baseline.json
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import random
+import sys
+import timeit
+import pygame as pg
+from data.components.grid import AutomataGrid
+from data.components.rules import is_staggered
+
+
+ENGINES = ("cells", "array", "sparse", "bitboard")
+SIZES = (400, 800, 1600)
+DENSITIES = (.1, .35, .6)
+DRAW_MODES = ("Squares", "Circles", "Lines")
+INFINITE_ENGINES = ("sparse", "hashlife")
+
+
+def timed(func, *args):
+    start = timeit.default_timer()
+    func(*args)
+    return timeit.default_timer() - start
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {"mean_ms": 1000. * sum(samples) / len(samples),
+               "median_ms": 1000. * samples[len(samples)//2],
+               "min_ms": 1000. * samples[0],
+               "samples": len(samples)}
+
+
+def make_grid(rule, engine, size, density, cell_size, seed):
+    grid = AutomataGrid(size, size, cell_size, rule, staggered=is_staggered(rule),
+                                infinite=engine in INFINITE_ENGINES, engine=engine)
+    rng = random.Random(seed)
+    grid.set_cells((index, rng.random() < density) for index in grid.indices())
+    return grid
+
+
+def bench_case(rule, engine, size, density, options):
+    """Yield one result dict per timed phase for a single board."""
+    case = {"rule": rule, "engine": engine, "size": size, "density": density}
+    grid = make_grid(rule, engine, size, density, options.cell_size, options.seed)
+    surface = pg.Surface((size, size))
+    samples = [timed(grid.update) for _ in range(options.generations)]
+    yield dict(case, phase="update", mode=None, **summary(samples))
+    for mode in options.modes:
+        grid.draw_mode = mode
+        if mode == "Lines":
+            yield dict(case, phase="lines_rebuild", mode=mode,
+                          **summary([timed(grid.connections.rebuild)]))
+            samples = []
+            for _ in range(options.generations):
+                grid.engine.step()
+                samples.append(timed(grid.connections.update, grid.engine.changes()))
+            yield dict(case, phase="lines_update", mode=mode, **summary(samples))
+        samples = [timed(grid.draw, surface) for _ in range(options.frames)]
+        yield dict(case, phase="draw", mode=mode, **summary(samples))
+    close = getattr(grid.engine, "close", None)
+    if close is not None:
+        close()
+
+
+def run(options):
+    results = []
+    for rule in options.rules:
+        for engine in options.engines:
+            for size in options.sizes:
+                for density in options.densities:
+                    try:
+                        for result in bench_case(rule, engine, size, density, options):
+                            results.append(result)
+                            if options.verbose:
+                                print(format_result(result))
+                    except ValueError as e:
+                        if options.verbose:
+                            print("skipped {} / {}: {}".format(rule, engine, e))
+    return results
+
+
+def result_key(result):
+    return (result["rule"], result["engine"], result["size"], result["density"],
+               result["phase"], result["mode"])
+
+
+def format_result(result):
+    mode = " {}".format(result["mode"]) if result["mode"] else ""
+    return "{rule} [{engine}] {size}px @{density}: {phase}{0} {mean_ms:.3f}ms".format(
+                mode, **result)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return (result, baseline_result) pairs whose median time grew by more
+    than tolerance (a fraction) over the baseline.
+    """
+    old = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = old.get(result_key(result))
+        if before is not None and result["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append((result, before))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", nargs="+", default=sorted(AutomataGrid.rules),
+                                  help="rule names or B/S rule strings")
+    parser.add_argument("--engines", nargs="+", default=ENGINES,
+                                  choices=sorted(AutomataGrid.engines))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES,
+                                  help="board width and height in pixels")
+    parser.add_argument("--densities", nargs="+", type=float, default=DENSITIES)
+    parser.add_argument("--modes", nargs="+", default=DRAW_MODES, choices=DRAW_MODES)
+    parser.add_argument("--cell-size", type=int, default=8)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default="benchmark-baseline.json")
+    parser.add_argument("--save-baseline", action="store_true",
+                                  help="write the results to the baseline file too")
+    parser.add_argument("--tolerance", type=float, default=.25,
+                                  help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    results = run(options)
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print("{} results written to {}".format(len(results), options.output))
+    if options.save_baseline:
+        with open(options.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print("baseline saved to {}".format(options.baseline))
+        return 0
+    if not os.path.exists(options.baseline):
+        print("no baseline at {}, nothing to compare".format(options.baseline))
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.tolerance)
+    for result, before in regressions:
+        print("REGRESSION {} (was {:.3f}ms)".format(format_result(result), before["median_ms"]))
+    print("{} regressions".format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+A bit-packed engine for two-state Life-like rules. Each row of the board is
+stored as a run of 64-bit words, one bit per cell, and neighbor counts are
+built 64 cells at a time with bitwise adders.
+"""
+import numpy as np
+
+
+WORD = 64
+ONE = np.uint64(1)
+TOP_SHIFT = np.uint64(WORD - 1)
+EVEN_COLUMNS = np.uint64(0x5555555555555555)
+ODD_COLUMNS = np.uint64(0xAAAAAAAAAAAAAAAA)
+ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def unpack_bits(words):
+    """Return every bit of a 2D array of words as a uint8 array indexed [bit column, row]."""
+    return np.unpackbits(words.view(np.uint8), axis=1, bitorder="little").T
+
+
+def shift_west(words):
+    """Move each cell's west neighbor into the cell's bit."""
+    shifted = words << ONE
+    shifted[:, 1:] |= words[:, :-1] >> TOP_SHIFT
+    return shifted
+
+
+def shift_east(words):
+    """Move each cell's east neighbor into the cell's bit."""
+    shifted = words >> ONE
+    shifted[:, :-1] |= words[:, 1:] << TOP_SHIFT
+    return shifted
+
+
+class BitboardEngine(object):
+    """
+    Stores the board in a (rows + 2, words per row) array of little-endian
+    uint64 words. The first and last rows are an always-dead halo so the
+    rows above and below any band are plain slices. Steps are computed in
+    bands of rows to keep the temporaries small. Supports the Moore
+    neighborhood and the staggered lattice; the board is bounded.
+    """
+    def __init__(self, world):
+        if world.infinite:
+            raise ValueError("BitboardEngine does not support infinite grids")
+        self.columns = world.columns
+        self.rows = world.rows
+        self.staggered = world.staggered
+        self.width = (self.columns + WORD - 1) // WORD
+        self.words = np.zeros((self.rows + 2, self.width), dtype="<u8")
+        self.spare = np.zeros_like(self.words)
+        tail = self.columns % WORD
+        self.tail_mask = np.uint64((1 << tail) - 1) if tail else ALL_BITS
+        self.band = 256
+        self.set_rule(world.rule)
+
+    def set_rule(self, rule):
+        """Keep the counts each row of the rule's table is set for, to match against bit planes."""
+        self.birth_nums = tuple(np.flatnonzero(rule.table[0]).tolist())
+        self.survive_nums = tuple(np.flatnonzero(rule.table[1]).tolist())
+
+    def count_planes(self, block):
+        """
+        Return the neighbor counts of block[1:-1] as four bit planes
+        (ones, twos, fours, eights). block must include the rows directly
+        above and below.
+        """
+        west = shift_west(block)
+        east = shift_east(block)
+        west_east = west ^ east
+        pair0, pair1 = west_east, west & east
+        triple0 = west_east ^ block
+        triple1 = pair1 | (west_east & block)
+        if not self.staggered:
+            a0, a1 = triple0[:-2], triple1[:-2]
+            c0, c1 = triple0[2:], triple1[2:]
+        else:
+            above, below = block[:-2], block[2:]
+            a0 = (triple0[:-2] & ODD_COLUMNS) | (above & EVEN_COLUMNS)
+            a1 = triple1[:-2] & ODD_COLUMNS
+            c0 = (triple0[2:] & EVEN_COLUMNS) | (below & ODD_COLUMNS)
+            c1 = triple1[2:] & EVEN_COLUMNS
+        b0, b1 = pair0[1:-1], pair1[1:-1]
+        ones = a0 ^ b0 ^ c0
+        carry = (a0 & b0) | (c0 & (a0 ^ b0))
+        half = a1 ^ b1 ^ c1
+        fours_a = (a1 & b1) | (c1 & (a1 ^ b1))
+        twos = half ^ carry
+        fours_b = half & carry
+        return ones, twos, fours_a ^ fours_b, fours_a & fours_b
+
+    def matches(self, planes, nums):
+        result = np.zeros_like(planes[0])
+        for num in nums:
+            term = None
+            for i, plane in enumerate(planes):
+                bits = plane if num >> i & 1 else ~plane
+                term = bits if term is None else term & bits
+            result |= term
+        return result
+
+    def step(self):
+        words, out = self.words, self.spare
+        for top in range(0, self.rows, self.band):
+            bottom = min(top + self.band, self.rows)
+            block = words[top:bottom + 2]
+            planes = self.count_planes(block)
+            alive = block[1:-1]
+            out[top + 1:bottom + 1] = ((alive & self.matches(planes, self.survive_nums)) |
+                                       (~alive & self.matches(planes, self.birth_nums)))
+        out[1:-1, -1] &= self.tail_mask
+        self.words, self.spare = out, words
+
+    def change_arrays(self):
+        """
+        Return the columns and rows of the cells flipped by the last step.
+        Only the words that changed are unpacked, so a settled board costs
+        little more than finding them.
+        """
+        flips = (self.words ^ self.spare)[1:-1]
+        rows, words = np.nonzero(flips)
+        if not len(rows):
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        bits = np.unpackbits(flips[rows, words].view(np.uint8).reshape(-1, 8), axis=1,
+                                       bitorder="little")
+        which, bit = np.nonzero(bits)
+        columns = words[which] * WORD + bit
+        return columns, rows[which]
+
+    def changes(self):
+        columns, rows = self.change_arrays()
+        return list(zip(columns.tolist(), rows.tolist()))
+
+    def locate(self, index):
+        column, row = index
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return row + 1, column // WORD, np.uint64(1 << (column % WORD))
+        return None
+
+    def get(self, index):
+        location = self.locate(index)
+        if location is None:
+            return False
+        row, word, bit = location
+        return bool(self.words[row, word] & bit)
+
+    def set(self, index, alive):
+        location = self.locate(index)
+        if location is not None:
+            row, word, bit = location
+            if alive:
+                self.words[row, word] |= bit
+            else:
+                self.words[row, word] &= ALL_BITS ^ bit
+
+    def clear(self):
+        self.words.fill(0)
+
+    def randomize(self):
+        noise = np.random.randint(0, 256, (self.rows, self.width * 8), dtype=np.uint8)
+        self.words[1:-1] = noise.view("<u8")
+        self.words[1:-1, -1] &= self.tail_mask
+
+    def unpack(self, words):
+        return unpack_bits(words)[:self.columns]
+
+    def to_array(self):
+        """Return the board as a dense uint8 array indexed [column, row]."""
+        return self.unpack(self.words[1:-1])
+
+    def load(self, cells):
+        """Replace the board with a dense array indexed [column, row]."""
+        padded = np.zeros((self.rows, self.width * WORD), dtype=np.uint8)
+        padded[:, :self.columns] = np.asarray(cells, dtype=bool).T
+        self.words[1:-1] = np.packbits(padded, axis=1, bitorder="little").view("<u8")
+
+    def neighbor_counts(self, words):
+        counts = np.zeros((self.columns, self.rows), dtype=np.uint8)
+        for top in range(0, self.rows, self.band):
+            bottom = min(top + self.band, self.rows)
+            planes = self.count_planes(words[top:bottom + 2])
+            for weight, plane in zip((1, 2, 4, 8), planes):
+                counts[:, top:bottom] += self.unpack(plane) * np.uint8(weight)
+        return counts
+
+    def cell_array(self):
+        cells = self.to_array()
+        return cells * (self.neighbor_counts(self.spare) + 1)
+
+    def word_span(self, left, right):
+        """Return the first and last + 1 words holding columns left to right - 1."""
+        return left // WORD, (right + WORD - 1) // WORD
+
+    def to_array_in(self, left, top, right, bottom):
+        """
+        Return the part of the board with left <= column < right and
+        top <= row < bottom. Only the words covering it are unpacked.
+        """
+        first, last = self.word_span(left, right)
+        cells = unpack_bits(self.words[top + 1:bottom + 1, first:last])
+        return cells[left - first * WORD:right - first * WORD]
+
+    def cell_array_in(self, left, top, right, bottom):
+        """
+        Return cell_array for the cells with left <= column < right and
+        top <= row < bottom of the board only. Counts are taken over the
+        words covering the box plus one word either side, for the bits
+        that shift in across its edges.
+        """
+        first, last = self.word_span(left, right)
+        first, last = max(first - 1, 0), min(last + 1, self.width)
+        planes = self.count_planes(self.spare[top:bottom + 2, first:last])
+        counts = unpack_bits(planes[0])
+        for weight, plane in zip((2, 4, 8), planes[1:]):
+            counts += unpack_bits(plane) * np.uint8(weight)
+        start, stop = left - first * WORD, right - first * WORD
+        cells = unpack_bits(self.words[top + 1:bottom + 1, first:last])[start:stop]
+        return cells * (counts[start:stop] + 1)
+
+    def live_cells(self):
+        columns, rows = np.nonzero(self.to_array())
+        counts = self.neighbor_counts(self.spare)[columns, rows]
+        return [((c, r), n) for c, r, n in zip(columns.tolist(), rows.tolist(),
+                                                counts.tolist())]
@@ -0,0 +1,91 @@
+"""
+Click-and-drag editing for the Sim screen. A Brush turns a stroke of cell
+indices into (index, alive) edits that are queued and applied to the grid
+in one batch per frame.
+"""
+
+
+def line_indices(start, end):
+    """Return the indices on a Bresenham line from start to end, inclusive."""
+    (x0, y0), (x1, y1) = start, end
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    error = dx + dy
+    indices = []
+    while True:
+        indices.append((x0, y0))
+        if (x0, y0) == (x1, y1):
+            return indices
+        e2 = 2 * error
+        if e2 >= dy:
+            error += dy
+            x0 += sx
+        if e2 <= dx:
+            error += dx
+            y0 += sy
+
+
+def rect_indices(start, end):
+    """Return every index in the box with corners start and end."""
+    left, right = sorted((start[0], end[0]))
+    top, bottom = sorted((start[1], end[1]))
+    return [(column, row) for column in range(left, right + 1)
+               for row in range(top, bottom + 1)]
+
+
+class Brush(object):
+    """
+    Modes:
+        pen: paint along the drag. The stroke paints the opposite of the
+             first cell's state, so a plain click toggles a cell.
+        eraser: kill cells along the drag.
+        line: a live line from the press to the release.
+        rect: a filled live rectangle with the press and release as corners.
+    Line and rect strokes only show a preview until the button is released.
+    """
+    modes = ("pen", "eraser", "line", "rect")
+
+    def __init__(self, mode="pen"):
+        self.mode = mode
+        self.start = None
+        self.last = None
+        self.alive = True
+        self.preview = set()
+        self.edits = []
+
+    @property
+    def painting(self):
+        return self.start is not None
+
+    def press(self, index, alive_now):
+        self.start = self.last = index
+        if self.mode == "pen":
+            self.alive = not alive_now
+        else:
+            self.alive = self.mode != "eraser"
+        self.drag(index)
+
+    def drag(self, index):
+        if not self.painting:
+            return
+        if self.mode in ("pen", "eraser"):
+            self.edits.extend((i, self.alive) for i in line_indices(self.last, index))
+        elif self.mode == "line":
+            self.preview = set(line_indices(self.start, index))
+        else:
+            self.preview = set(rect_indices(self.start, index))
+        self.last = index
+
+    def release(self, index):
+        if not self.painting:
+            return
+        self.drag(index)
+        self.edits.extend((i, self.alive) for i in self.preview)
+        self.preview = set()
+        self.start = self.last = None
+
+    def take_edits(self):
+        """Return the edits made since the last call."""
+        edits, self.edits = self.edits, []
+        return edits
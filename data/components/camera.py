@@ -0,0 +1,122 @@
+"""
+The window onto an AutomataGrid. A Camera maps between screen positions and
+cell indices for any zoom and pan, so the board can be bigger than the
+screen and the cells of an infinite grid can be followed wherever they go.
+"""
+import pygame as pg
+
+
+def zoom_levels(cell_size, max_size=32, max_scale=64):
+    """
+    Return the (size, scale) zoom levels from farthest to closest: size is
+    screen pixels per cell and scale is cells per screen pixel. Scales are
+    powers of two so blocks of cells line up with HashLife's quadtree.
+    """
+    levels = set((1, 1 << n) for n in range(max_scale.bit_length()))
+    levels.update((1 << n, 1) for n in range(max_size.bit_length()))
+    levels.add((cell_size, 1))
+    return sorted(levels, key=lambda level: float(level[0]) / level[1])
+
+
+class Camera(object):
+    """
+    view is (left, top, size, scale): the index of the cell in the top-left
+    corner of the screen, screen pixels per cell and cells per pixel. One
+    of size and scale is always 1. Pans move the view by whole cells (or
+    whole blocks of scale cells when zoomed out) and carry the leftover
+    pixels to the next pan. The view is replaced in one assignment, so the
+    worker thread always reads a consistent one.
+    """
+    def __init__(self, width, height, cell_size, staggered=False):
+        self.width = width
+        self.height = height
+        self.staggered = staggered
+        self.home = (0, 0, cell_size, 1)
+        self.levels = zoom_levels(cell_size)
+        self.view = self.home
+        self.drift = [0, 0]
+
+    @property
+    def at_home(self):
+        return self.view == self.home
+
+    @property
+    def zoomed_out(self):
+        """True when a screen pixel covers more than one cell."""
+        return self.view[3] > 1
+
+    def reset(self):
+        self.view = self.home
+        self.drift = [0, 0]
+
+    def box(self, view=None, margin=0):
+        """
+        Return (left, top, right, bottom), the cells with left <= column <
+        right and top <= row < bottom that show on screen, plus margin
+        cells on every side.
+        """
+        left, top, size, scale = view or self.view
+        if scale > 1:
+            columns, rows = self.width * scale, self.height * scale
+        else:
+            columns = len(range(size//2, self.width, size))
+            rows = len(range(size//2, self.height, size))
+        return (left - margin, top - margin,
+                left + columns + margin, top + rows + margin)
+
+    def index_at(self, pos, view=None):
+        """Return the index of the cell under screen position pos."""
+        left, top, size, scale = view or self.view
+        if scale > 1:
+            return left + pos[0] * scale, top + pos[1] * scale
+        column = left + pos[0] // size
+        y = pos[1]
+        if self.staggered and column % 2:
+            y -= size//2
+        return column, top + y // size
+
+    def cell_rect(self, index, view=None):
+        """Return the screen rect of the cell at index."""
+        left, top, size, scale = view or self.view
+        if scale > 1:
+            return pg.Rect((index[0] - left) // scale, (index[1] - top) // scale, 1, 1)
+        y = (index[1] - top) * size
+        if self.staggered and index[0] % 2:
+            y += size//2
+        return pg.Rect((index[0] - left) * size, y, size, size)
+
+    def indices_in(self, rect):
+        """Return the indices of every cell that overlaps the screen rect (when not zoomed out)."""
+        left, top, size, _ = self.view
+        rows = range(top + (rect.top - size) // size, top + (rect.bottom - 1) // size + 1)
+        columns = range(left + rect.left // size, left + (rect.right - 1) // size + 1)
+        return ((column, row) for column in columns for row in rows)
+
+    def pan(self, dx, dy):
+        """Move the view so the board follows a drag of dx, dy screen pixels."""
+        left, top, size, scale = self.view
+        x, y = self.drift[0] - dx, self.drift[1] - dy
+        steps_x, steps_y = x // size, y // size
+        self.drift = [x - steps_x * size, y - steps_y * size]
+        if steps_x or steps_y:
+            self.view = left + steps_x * scale, top + steps_y * scale, size, scale
+
+    def zoom_at(self, pos, steps):
+        """
+        Zoom in (steps > 0) or out by steps levels, keeping the cell under
+        screen position pos where it is.
+        """
+        left, top, size, scale = self.view
+        level = self.levels.index((size, scale))
+        level = max(0, min(len(self.levels) - 1, level + steps))
+        new_size, new_scale = self.levels[level]
+        if (new_size, new_scale) == (size, scale):
+            return
+        anchor = self.index_at(pos)
+        left = anchor[0] - pos[0] * new_scale // new_size
+        top = anchor[1] - pos[1] * new_scale // new_size
+        if new_scale > 1:
+            left -= left % new_scale
+            top -= top % new_scale
+        self.view = left, top, new_size, new_scale
+        self.drift = [0, 0]
@@ -0,0 +1,190 @@
+"""
+Saves and restores a whole AutomataGrid: its rule, lattice, generation and
+every live cell. A checkpoint file is the magic bytes, a short JSON header
+and then the cells, either as a bitmap packed eight cells to a byte or,
+for spread out universes where that is smaller, as little-endian int64
+(column, row) pairs. The cells start on a 64 byte boundary and may be zlib
+compressed. Uncompressed files are memory-mapped when loaded, so a large
+board is only read as it is unpacked.
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from .grid import AutomataGrid
+from .history import as_arrays
+
+
+MAGIC = b"AUTOMATA"
+VERSION = 1
+ALIGN = 64
+CHUNK_COLUMNS = 1024
+CHUNK_POINTS = 1 << 16
+
+
+def latest(directory):
+    """Return the path of the newest checkpoint in directory, or None."""
+    if not os.path.isdir(directory):
+        return None
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+               if name.endswith(".ckpt")]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def capture(grid):
+    """
+    Return a Checkpoint of grid as it is now. Only the cells are copied;
+    packing and compressing wait until the checkpoint is written, so this
+    is cheap enough to call between generations on the worker thread.
+    """
+    header = {"version": VERSION,
+                  "rule": grid.sim_name,
+                  "birth": list(grid.birth_nums),
+                  "survive": list(grid.survive_nums),
+                  "staggered": grid.staggered,
+                  "infinite": grid.infinite,
+                  "engine": grid.engine_name,
+                  "size": list(grid.size),
+                  "cell_size": grid.cell_size,
+                  "generation": grid.generation}
+    if hasattr(grid.engine, "to_array"):
+        cells = grid.engine.to_array().astype(bool)
+        header.update(encoding="bitmap", origin=[0, 0], shape=list(cells.shape))
+        return Checkpoint(header, cells=cells)
+    columns, rows = as_arrays(index for index, _ in grid.live_cells())
+    if not len(columns):
+        header.update(encoding="points", origin=[0, 0], shape=[0, 0])
+        return Checkpoint(header, data=np.zeros((0, 2), dtype="<i8"))
+    left, top = int(columns.min()), int(rows.min())
+    width, height = int(columns.max()) - left + 1, int(rows.max()) - top + 1
+    header.update(origin=[left, top], shape=[width, height])
+    if width * ((height + 7) // 8) < 16 * len(columns):
+        cells = np.zeros((width, height), dtype=bool)
+        cells[columns - left, rows - top] = True
+        header["encoding"] = "bitmap"
+        return Checkpoint(header, cells=cells)
+    header["encoding"] = "points"
+    return Checkpoint(header, data=np.stack([columns, rows], 1).astype("<i8"))
+
+
+def load(path):
+    """Read the checkpoint at path, memory-mapping its cells if they aren't compressed."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a checkpoint file: {}".format(path))
+        length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+        if header["version"] > VERSION:
+            raise ValueError("Checkpoint version {} is too new: {}".format(header["version"], path))
+        offset = f.tell()
+        dtype, shape = np.dtype(header["dtype"]), tuple(header["data_shape"])
+        if header["compression"] == "zlib":
+            raw = zlib.decompress(f.read(header["length"]))
+            return Checkpoint(header, data=np.frombuffer(raw, dtype).reshape(shape))
+    if not header["length"]:
+        return Checkpoint(header, data=np.zeros(shape, dtype))
+    return Checkpoint(header, data=np.memmap(path, dtype, "r", offset, shape))
+
+
+class Checkpoint(object):
+    """
+    header holds everything but the cells. A bitmap checkpoint covers the
+    box of header["shape"] cells whose top-left cell is header["origin"],
+    held as a bool array (cells) when captured and packed along the rows
+    of each column (data) when written or loaded. A points checkpoint
+    holds an (n, 2) array of live indices as data.
+    """
+    def __init__(self, header, cells=None, data=None):
+        self.header = header
+        self.cells = cells
+        self._data = data
+
+    @property
+    def data(self):
+        """The cells as they are laid out in the file."""
+        if self._data is None:
+            self._data = np.packbits(self.cells, axis=1, bitorder="little")
+        return self._data
+
+    @property
+    def generation(self):
+        return self.header["generation"]
+
+    def write(self, path, compress=True):
+        """
+        Write the checkpoint to path. The file is written beside path and
+        moved into place, so a reader never sees half a checkpoint.
+        """
+        data = np.ascontiguousarray(self.data)
+        payload = zlib.compress(data, 1) if compress else data.reshape(-1).view(np.uint8)
+        header = dict(self.header, compression="zlib" if compress else None,
+                            dtype=data.dtype.str, data_shape=list(data.shape),
+                            length=len(payload))
+        text = json.dumps(header).encode("utf-8")
+        text += b" " * (-(len(MAGIC) + 4 + len(text)) % ALIGN)
+        temp_path = path + ".part"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(text)))
+            f.write(text)
+            f.write(payload)
+        os.replace(temp_path, path)
+
+    def write_in_background(self, path, compress=True):
+        """Write the checkpoint on a new thread and return the thread."""
+        thread = threading.Thread(target=self.write, args=(path, compress))
+        thread.start()
+        return thread
+
+    def to_array(self):
+        """Return a bitmap checkpoint's cells as a bool array indexed [column, row] from the origin."""
+        if self.cells is None:
+            rows = self.header["shape"][1]
+            self.cells = np.unpackbits(self.data, axis=1, count=rows,
+                                                 bitorder="little").astype(bool)
+        return self.cells
+
+    def live_arrays(self):
+        """
+        Yield the live cells as (columns, rows) int64 arrays, a block at a
+        time, so a memory-mapped file is only unpacked a piece at a time.
+        """
+        data = self.data
+        if self.header["encoding"] == "points":
+            for start in range(0, len(data), CHUNK_POINTS):
+                chunk = np.asarray(data[start:start + CHUNK_POINTS], dtype=np.int64)
+                yield chunk[:, 0], chunk[:, 1]
+            return
+        left, top = self.header["origin"]
+        width, height = self.header["shape"]
+        for start in range(0, width, CHUNK_COLUMNS):
+            block = np.unpackbits(data[start:start + CHUNK_COLUMNS], axis=1, count=height,
+                                              bitorder="little")
+            columns, rows = np.nonzero(block)
+            yield columns + (start + left), rows + top
+
+    def restore(self, grid):
+        """Replace grid's cells and generation with the checkpoint's."""
+        header = self.header
+        if (header["encoding"] == "bitmap" and header["origin"] == [0, 0] and
+                header["shape"] == [grid.columns, grid.rows] and
+                hasattr(grid.engine, "load")):
+            grid.load(self.to_array())
+        else:
+            grid.clear()
+            grid.set_cells(((column, row), True) for columns, rows in self.live_arrays()
+                                 for column, row in zip(columns.tolist(), rows.tolist()))
+        grid.generation = header["generation"]
+        grid.version += 1
+
+    def make_grid(self, engine=None):
+        """Return a new AutomataGrid in the checkpoint's state, using engine or the saved one."""
+        header = self.header
+        width, height = header["size"]
+        grid = AutomataGrid(width, height, header["cell_size"], header["rule"],
+                                     staggered=header["staggered"], infinite=header["infinite"],
+                                     engine=engine or header["engine"])
+        self.restore(grid)
+        return grid
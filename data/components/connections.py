@@ -0,0 +1,83 @@
+"""
+The connection graph drawn in "Lines" mode. Every pair of neighboring live
+cells is one edge, stored once under its canonical (smaller index first)
+pair. Each edge sits in the bucket of the larger degree of its two cells,
+which picks its color.
+"""
+from collections import defaultdict
+
+
+def edge(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+class ConnectionIndex(object):
+    """
+    Edges are updated only around cells whose state changed. Anything that
+    edits the grid behind its back marks the index stale, and the next
+    update rebuilds it from the live cells.
+    """
+    def __init__(self, world):
+        self.world = world
+        self.links = {}
+        self.buckets = defaultdict(set)
+        self.edge_buckets = {}
+        self.stale = True
+
+    def rebuild(self):
+        self.links = {}
+        self.buckets = defaultdict(set)
+        self.edge_buckets = {}
+        self.stale = False
+        self.update([index for index, _ in self.world.live_cells()])
+
+    def update(self, changed):
+        """Bring the index in line with the grid after the cells in changed flipped."""
+        if self.stale or changed is None:
+            self.rebuild()
+            return
+        is_alive = self.world.is_alive
+        touched = set()
+        for index in changed:
+            neighbors = self.world.neighbors(index)
+            touched.add(index)
+            touched.update(neighbors)
+            old = self.links.get(index, set())
+            if is_alive(index):
+                linked = {other for other in neighbors if is_alive(other)}
+                for other in old - linked:
+                    self.unlink(index, other)
+                for other in linked - old:
+                    self.link(index, other)
+                self.links.setdefault(index, set())
+            else:
+                for other in list(old):
+                    self.unlink(index, other)
+                self.links.pop(index, None)
+        for index in touched:
+            self.rebucket(index)
+
+    def link(self, a, b):
+        self.links.setdefault(a, set()).add(b)
+        self.links.setdefault(b, set()).add(a)
+
+    def unlink(self, a, b):
+        self.links[a].discard(b)
+        self.links[b].discard(a)
+        key = edge(a, b)
+        bucket = self.edge_buckets.pop(key, None)
+        if bucket is not None:
+            self.buckets[bucket].discard(key)
+
+    def rebucket(self, index):
+        links = self.links
+        degree = len(links.get(index, ()))
+        for other in links.get(index, ()):
+            key = edge(index, other)
+            bucket = max(degree, len(links[other]))
+            old = self.edge_buckets.get(key)
+            if old != bucket:
+                if old is not None:
+                    self.buckets[old].discard(key)
+                self.buckets[bucket].add(key)
+                self.edge_buckets[key] = bucket
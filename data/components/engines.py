@@ -0,0 +1,235 @@
+"""
+Alternate stepping engines for AutomataGrid. Every engine is built from the
+AutomataGrid that owns it and exposes the same small interface:
+step, get, set, clear, randomize, live_cells and changes.
+"""
+import random
+from collections import defaultdict
+import numpy as np
+from .. import tools
+from .hashlife import HashLifeEngine
+
+
+def count_moore(cells, counts):
+    """
+    Write the number of live Moore neighbors of every cell of cells into
+    counts, treating everything past the edges as dead.
+    """
+    counts.fill(0)
+    counts[1:, :] += cells[:-1, :]
+    counts[:-1, :] += cells[1:, :]
+    counts[:, 1:] += cells[:, :-1]
+    counts[:, :-1] += cells[:, 1:]
+    counts[1:, 1:] += cells[:-1, :-1]
+    counts[:-1, :-1] += cells[1:, 1:]
+    counts[1:, :-1] += cells[:-1, 1:]
+    counts[:-1, 1:] += cells[1:, :-1]
+
+
+def count_staggered(cells, counts, first_column_odd=False):
+    """
+    Write the number of live neighbors of every cell of cells on the
+    staggered lattice into counts. Even columns reach down to the row below
+    on both sides and odd columns reach up to the row above. Set
+    first_column_odd when cells starts at an odd column of the board.
+    """
+    side = np.zeros_like(counts)
+    side[1:, :] += cells[:-1, :]
+    side[:-1, :] += cells[1:, :]
+    counts[...] = side
+    counts[:, 1:] += cells[:, :-1]
+    counts[:, :-1] += cells[:, 1:]
+    even, odd = (slice(1, None, 2), slice(0, None, 2)) if first_column_odd else (
+                 slice(0, None, 2), slice(1, None, 2))
+    counts[even, :-1] += side[even, 1:]
+    counts[odd, 1:] += side[odd, :-1]
+
+
+class ArrayEngine(object):
+    """
+    Keeps the board as a dense uint8 array indexed [column, row] and counts
+    neighbors by summing shifted slices of it, with parity-specific slices
+    for the staggered lattice. The next generation is read from a lookup
+    table indexed by (alive, num_live_neighbors). The board is bounded:
+    cells past the edges are always dead.
+    """
+    def __init__(self, world):
+        if world.infinite:
+            raise ValueError("ArrayEngine does not support infinite grids")
+        self.columns = world.columns
+        self.rows = world.rows
+        self.staggered = world.staggered
+        self.cells = np.zeros((self.columns, self.rows), dtype=np.uint8)
+        self.counts = np.zeros((self.columns, self.rows), dtype=np.uint8)
+        self.previous = self.cells
+        self.set_rule(world.rule)
+
+    def set_rule(self, rule):
+        self.table = rule.table
+
+    def count_neighbors(self):
+        if self.staggered:
+            count_staggered(self.cells, self.counts)
+        else:
+            count_moore(self.cells, self.counts)
+
+    def step(self):
+        mark = tools.PROFILER.mark()
+        self.count_neighbors()
+        mark = tools.PROFILER.record("neighbors", mark)
+        self.previous = self.cells
+        self.cells = self.table[self.cells, self.counts]
+        tools.PROFILER.record("rules", mark)
+
+    def change_arrays(self):
+        """Return the columns and rows of the cells flipped by the last step as arrays."""
+        return np.nonzero(self.cells != self.previous)
+
+    def changes(self):
+        columns, rows = self.change_arrays()
+        return list(zip(columns.tolist(), rows.tolist()))
+
+    def in_bounds(self, index):
+        return 0 <= index[0] < self.columns and 0 <= index[1] < self.rows
+
+    def get(self, index):
+        return self.in_bounds(index) and bool(self.cells[index])
+
+    def set(self, index, alive):
+        if self.in_bounds(index):
+            self.cells[index] = alive
+
+    def clear(self):
+        self.cells.fill(0)
+
+    def randomize(self):
+        self.cells[...] = np.random.randint(0, 2, self.cells.shape)
+
+    def to_array(self):
+        """Return a copy of the board as a dense uint8 array indexed [column, row]."""
+        return self.cells.copy()
+
+    def load(self, cells):
+        """Replace the board with a dense array indexed [column, row]."""
+        self.cells[...] = np.asarray(cells, dtype=bool)
+
+    def cell_array(self):
+        return np.where(self.cells, self.counts + 1, 0).astype(np.uint8)
+
+    def cell_array_in(self, left, top, right, bottom):
+        """Return cell_array for the cells with left <= column < right and top <= row < bottom of the board only."""
+        cells = self.cells[left:right, top:bottom]
+        return np.where(cells, self.counts[left:right, top:bottom] + 1, 0).astype(np.uint8)
+
+    def to_array_in(self, left, top, right, bottom):
+        """Return the part of the board with left <= column < right and top <= row < bottom."""
+        return self.cells[left:right, top:bottom]
+
+    def live_cells(self):
+        columns, rows = np.nonzero(self.cells)
+        counts = self.counts[columns, rows]
+        return [((c, r), n) for c, r, n in zip(columns.tolist(), rows.tolist(),
+                                                counts.tolist())]
+
+
+class SparseEngine(object):
+    """
+    Stores only the indices of live cells in a set, so memory and step time
+    scale with the population rather than the extent of the universe. The
+    universe is unbounded: neighbors are counted around live cells only and
+    dead cells are dropped as soon as they die.
+
+    advance jumps many generations at once by running the live cells
+    through a HashLifeEngine on square grids. The HashLifeEngine is kept
+    between jumps, so its memoized results carry over to the next one.
+    """
+    def __init__(self, world):
+        if not world.infinite:
+            raise ValueError("SparseEngine only supports infinite grids")
+        self.world = world
+        self.columns = world.columns
+        self.rows = world.rows
+        self.offsets = (world.neighbor_offsets((0, 0)),
+                             world.neighbor_offsets((1, 0)))
+        self.live = set()
+        self.previous = self.live
+        self.counts = {}
+        self.set_rule(world.rule)
+
+    def set_rule(self, rule):
+        self.birth, self.survive = rule.lists()
+        if self.birth[0]:
+            raise ValueError("SparseEngine does not support birth on 0 neighbors")
+        self.hashlife = None
+
+    def step(self):
+        mark = tools.PROFILER.mark()
+        counts = defaultdict(int)
+        offsets = self.offsets
+        for x, y in self.live:
+            for dx, dy in offsets[x % 2]:
+                counts[x + dx, y + dy] += 1
+        mark = tools.PROFILER.record("neighbors", mark)
+        live = self.live
+        birth, survive = self.birth, self.survive
+        survivors = {index for index in live if survive[counts.get(index, 0)]}
+        births = {index for index, num in counts.items()
+                     if birth[num] and index not in live}
+        self.previous = live
+        self.live = survivors | births
+        self.counts = counts
+        tools.PROFILER.record("rules", mark)
+
+    def advance(self, generations):
+        if self.world.staggered:
+            for _ in range(generations):
+                self.step()
+            return
+        if self.hashlife is None:
+            self.hashlife = HashLifeEngine(self.world)
+        hashlife = self.hashlife
+        hashlife.clear()
+        for index in self.live:
+            hashlife.set(index, True)
+        hashlife.advance(generations)
+        self.previous = self.live
+        self.counts = dict(hashlife.live_cells())
+        self.live = set(self.counts)
+
+    def changes(self):
+        return self.live ^ self.previous
+
+    def get(self, index):
+        return index in self.live
+
+    def set(self, index, alive):
+        if alive:
+            self.live.add(index)
+        else:
+            self.live.discard(index)
+
+    def clear(self):
+        self.live.clear()
+
+    def randomize(self):
+        self.live = {(column, row) for column in range(self.columns)
+                         for row in range(self.rows) if random.random() < .5}
+
+    def live_cells(self):
+        counts = self.counts
+        return [(index, counts.get(index, 0)) for index in self.live]
+
+    def live_cells_in(self, left, top, right, bottom):
+        """
+        Return live_cells for the cells with left <= column < right and
+        top <= row < bottom only. Either every index in the box is looked
+        up or the whole population is filtered, whichever is fewer.
+        """
+        live, counts = self.live, self.counts
+        if (right - left) * (bottom - top) < len(live):
+            found = [(column, row) for column in range(left, right)
+                        for row in range(top, bottom) if (column, row) in live]
+        else:
+            found = [(column, row) for column, row in live
+                        if left <= column < right and top <= row < bottom]
+        return [(index, counts.get(index, 0)) for index in found]
@@ -1,61 +1,37 @@
-from collections import defaultdict
+import numpy as np
 import pygame as pg
-from .. import prepare
+from .. import tools
+from .camera import Camera
+from .store import CellStore
+from .engines import ArrayEngine, SparseEngine
+from .bitboard import BitboardEngine
+from .hashlife import HashLifeEngine
+from .tiled import TiledEngine
+from .larger import LargerEngine
+from .connections import ConnectionIndex
+from .history import StateHistory, as_arrays
+from .rules import Rule, LargerRule, parse as parse_rule
+from . import patternfiles
+from .renderer import FrameRenderer
+
+
+def scale_colormap(colormap, size):
+    """
+    Return colormap stretched to size colors by blending between its
+    colors, for rules that count more neighbors than it has colors.
+    """
+    if len(colormap) >= size:
+        return colormap
+    colors = [colormap[num] for num in sorted(colormap)]
+    last = len(colors) - 1
+    scaled = {}
+    for num in range(size):
+        position = num * last / float(size - 1)
+        i = min(int(position), last - 1)
+        scaled[num] = colors[i].lerp(colors[i + 1], position - i)
+    return scaled
 
-class Cell(object):    
-    def __init__(self, index, center, cell_size, offsets):
-        self.index = index
-        self.rect = pg.Rect((0,0), (cell_size, cell_size))
-        self.rect.center = center
-        self.neighbor_indices = [(self.index[0] + offset[0], self.index[1] + offset[1])
-                                         for offset in offsets]
-        self.alive = False
-        self.connections = []
-        self.old_connections = []
-        self.last_alive = self.alive
-        self.num_live_neighbors = 0
-        
-    def get_connections(self, world):
-        if self.alive:
-            grid = world.grid
-            connections = []
-            for indx in self.neighbor_indices:
-                try:
-                    other_cell = grid[indx]
-                except KeyError:
-                    other_cell = None
-                if other_cell and other_cell.alive:
-                    connections.append((self.rect.center, other_cell.rect.center))            
-            self.connections = connections
-            
-    def get_live_neighbors(self, world):
-        grid = world.grid
-        num_live_neighbors = 0
-        for indx in self.neighbor_indices:
-            try:
-                other_cell = grid[indx]
-            except KeyError:
-                if world.infinite and self.alive:
-                    w, h = self.rect.size
-                    x, y = indx[0] *  w, indx[1] *  h
-                    cx, cy = x * (w//2), y * (h//2)
-                    if not world.staggered:
-                        grid[indx] = Cell(indx, (x + (w//2), y + (h//2)), w, world.moore_offsets)
-                    elif not indx[0] % 2:
-                        grid[indx] = Cell(indx, (x + (w//2), y + (h//2)), w, world.even_offsets)
-                    else:
-                        grid[indx] = Cell(indx, (x + (w//2), y + h), w, world.odd_offsets)
-                    other_cell = grid[indx]
-                else:
-                    other_cell = None
-            if other_cell and other_cell.alive:
-                num_live_neighbors += 1
-        self.num_live_neighbors = num_live_neighbors
 
-    def draw(self, surface):
-        surface.blit(self.image, self.rect)
-        
-        
 class AutomataGrid(object):
     colors = {"Warm":  {x: pg.Color(250, 250 - (x*25), 5) for x in range(8, -1, -1)},
                                  #0: pg.Color("oldlace"),
@@ -100,88 +76,327 @@ class AutomataGrid(object):
     even_offsets = ((-1,0), (0,-1), (1,0), (1,1), (0,1), (-1,1))
     odd_offsets = ((-1,-1), (0,-1), (1,-1), (1,0), (0,1), (-1,0))
     moore_offsets = [(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1) if (x, y) != (0, 0)]
+    engines = {"cells": CellStore,
+                    "array": ArrayEngine,
+                    "sparse": SparseEngine,
+                    "bitboard": BitboardEngine,
+                    "hashlife": HashLifeEngine,
+                    "tiled": TiledEngine,
+                    "larger": LargerEngine}
     
     def __init__(self, width, height, cell_size, rule="Conway", 
-                      staggered=False, infinite=True, palette="Monochrome"):
+                      staggered=False, infinite=True, palette="Monochrome",
+                      engine=None):
         self.sim_name = rule
         self.staggered = staggered
+        self.rule = self.compile_rule(rule, staggered)
+        larger = isinstance(self.rule, LargerRule)
+        if larger or 0 in self.rule.birth:
+            # Larger than Life only has a dense engine, and birth on 0
+            # neighbors would fill an unbounded universe at once.
+            infinite = False
         self.infinite = infinite
-        self.birth_nums = self.rules[rule][0]
-        self.survive_nums = self.rules[rule][1]
+        self.birth_nums = self.rule.birth
+        self.survive_nums = self.rule.survive
         self.line_weight = 2
-        self.connections = {}
-        self.colormap = self.colors[palette]
+        self.connections = ConnectionIndex(self)
+        self.history = StateHistory(self)
+        self.set_palette(palette)
+        self.cell_size = cell_size
+        self.generation = 0
+        self.version = 0
+        if engine is None:
+            engine = "larger" if larger else "sparse" if infinite else "cells"
+        elif larger and engine != "larger":
+            raise ValueError("Larger than Life rules need the larger engine")
+        self.engine_name = engine
+        self.size = width, height
         self.make_grid(width, height, cell_size)
-        self.make_overlay(width, height, cell_size)
+        self.camera = Camera(width, height, cell_size, staggered)
+        self.overlays = tools.LRUCache(4)
+        self.renderer = FrameRenderer(self)
         self.draw_mode = "Squares"
-        self.cell_size = cell_size
         
-    def make_overlay(self, width, height, cell_size):
-        self.overlay = pg.Surface((width, height)).convert_alpha()
-        self.overlay.fill((0,0,0,0))
+    @classmethod
+    def compile_rule(cls, rule, staggered=False):
+        """
+        Return the Rule for one of the named rules or a rule string such
+        as "B36/S23". Rules on a staggered grid count its six neighbors.
+        """
+        if rule in cls.rules:
+            birth, survive = cls.rules[rule]
+            return Rule(birth, survive, staggered)
+        compiled = parse_rule(rule)
+        if compiled.hexagonal and not staggered:
+            raise ValueError("{} is a rule for staggered grids".format(rule))
+        if staggered and not compiled.hexagonal:
+            compiled = Rule(compiled.birth, compiled.survive, True)
+        return compiled
+
+    def set_palette(self, name):
+        """Draw with the named palette, stretched to a color for every count the rule can see."""
+        self.palette = name
+        self.colormap = scale_colormap(self.colors[name], self.rule.max_count + 1)
+
+    def get_overlay(self, view=None):
+        """
+        Return the grid line overlay for view (the camera's by default),
+        drawn the first time it is needed, or None when the cells are too
+        small to outline.
+        """
+        left, _, size, scale = view or self.camera.view
+        if scale > 1 or size < 4:
+            return None
+        return self.overlays.get((size, left % 2),
+                                           lambda: self.make_overlay(size, left % 2))
+        
+    def make_overlay(self, cell_size, odd=0):
+        width, height = self.size
+        overlay = pg.Surface((width, height), pg.SRCALPHA)
+        overlay.fill((0,0,0,0))
         color = pg.Color("gray30")
         if self.staggered:
-            for cell in self.grid.values():
-                pg.draw.rect(self.overlay, color, cell.rect, 1)
+            view = odd, 0, cell_size, 1
+            left, top, right, bottom = self.camera.box(view)
+            for column in range(left, right):
+                for row in range(top, bottom):
+                    pg.draw.rect(overlay, color, self.camera.cell_rect((column, row), view), 1)
         else:
             for x in range(0, width + 1, cell_size):
-                pg.draw.line(self.overlay, color, (x, 0), (x, height), 2)
+                pg.draw.line(overlay, color, (x, 0), (x, height), 2)
             for y in range(0, height + 1, cell_size):
-                pg.draw.line(self.overlay, color, (0, y), (width, y), 2)
+                pg.draw.line(overlay, color, (0, y), (width, y), 2)
+        return overlay
         
     def make_grid(self, width, height, cell_size):
-        self.grid = {}
-        for column, x in enumerate(range(cell_size//2, width, cell_size)):
-            for row, y in enumerate(range(cell_size//2, height, cell_size)):
-                if not self.staggered:
-                    self.grid[(column, row)] = Cell((column, row), (x, y), cell_size, self.moore_offsets)
-                elif not column % 2:
-                    self.grid[(column, row)] = Cell((column, row), (x, y), cell_size, self.even_offsets)
-                else:
-                    self.grid[(column, row)] = Cell((column, row), (x, y + cell_size//2), cell_size, self.odd_offsets)
-        self.end_column = column
-        self.end_row = row
+        self.columns = len(range(cell_size//2, width, cell_size))
+        self.rows = len(range(cell_size//2, height, cell_size))
+        self.end_column = self.columns - 1
+        self.end_row = self.rows - 1
+        self.engine = self.engines[self.engine_name](self)
         
-    def update(self):
-        for cel in self.grid.values():
-            cel.get_live_neighbors(self)
-        for cell_ in self.grid.values():
-            if cell_.alive:
-                if cell_.num_live_neighbors not in self.survive_nums:
-                    cell_.alive = False
+    def indices(self):
+        return ((column, row) for column in range(self.columns)
+                    for row in range(self.rows))
+                    
+    def neighbor_offsets(self, index):
+        if not self.staggered:
+            return self.moore_offsets
+        elif not index[0] % 2:
+            return self.even_offsets
+        return self.odd_offsets
+        
+    def neighbors(self, index):
+        return [(index[0] + dx, index[1] + dy) for dx, dy in self.neighbor_offsets(index)]
+        
+    def cell_rect(self, index):
+        return self.camera.cell_rect(index)
+        
+    def is_alive(self, index):
+        return self.engine.get(index)
+        
+    def set_alive(self, index, alive):
+        self.engine.set(index, alive)
+        self.connections.stale = True
+        self.history.stale = True
+        self.version += 1
+        
+    def set_cells(self, cells):
+        """Set many cells at once from an iterable of (index, alive) pairs."""
+        if hasattr(self.engine, "set_cells"):
+            self.engine.set_cells(cells)
+        else:
+            for index, alive in cells:
+                self.engine.set(index, alive)
+        self.connections.stale = True
+        self.history.stale = True
+        self.version += 1
+        
+    def load(self, cells):
+        """Replace every cell from a dense array indexed [column, row] the size of the board."""
+        self.engine.load(cells)
+        self.connections.stale = True
+        self.history.stale = True
+        self.version += 1
+        
+    def toggle(self, index):
+        self.set_alive(index, not self.engine.get(index))
+        
+    def clear(self):
+        self.engine.clear()
+        self.connections.stale = True
+        self.history.stale = True
+        self.version += 1
+        
+    def randomize(self):
+        self.engine.randomize()
+        self.connections.stale = True
+        self.history.stale = True
+        self.version += 1
+        
+    def live_cells(self):
+        return self.engine.live_cells()
+        
+    def cell_array(self, margin=0):
+        """
+        Return a uint8 array indexed [column + margin, row + margin] covering
+        the board plus margin cells on every side: 0 for dead cells and
+        1 + num_live_neighbors for live ones.
+        """
+        if hasattr(self.engine, "cell_array"):
+            return np.pad(self.engine.cell_array(), margin)
+        cells = np.zeros((self.columns + 2 * margin, self.rows + 2 * margin), dtype=np.uint8)
+        live = [(c + margin, r + margin, n + 1) for (c, r), n in self.live_cells()
+                  if -margin <= c < self.columns + margin and -margin <= r < self.rows + margin]
+        if live:
+            columns, rows, nums = zip(*live)
+            cells[columns, rows] = nums
+        return cells
+        
+    def live_cells_in(self, left, top, right, bottom):
+        """Return live_cells for the cells with left <= column < right and top <= row < bottom only."""
+        if hasattr(self.engine, "live_cells_in"):
+            return self.engine.live_cells_in(left, top, right, bottom)
+        return [(index, num) for index, num in self.live_cells()
+                  if left <= index[0] < right and top <= index[1] < bottom]
+        
+    def board_box(self, left, top, right, bottom):
+        """Return the part of a box that lies on the board, or None if none of it does."""
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, self.columns), min(bottom, self.rows)
+        if left < right and top < bottom:
+            return left, top, right, bottom
+        return None
+        
+    def view_array(self, view):
+        """
+        Return the cell_array of the cells the camera shows in view, with a
+        one cell margin, indexed [column - left + 1, row - top + 1]. The
+        cost follows the size of the view, not of the universe.
+        """
+        left, top, right, bottom = self.camera.box(view, 1)
+        cells = np.zeros((right - left, bottom - top), dtype=np.uint8)
+        if hasattr(self.engine, "cell_array_in"):
+            box = self.board_box(left, top, right, bottom)
+            if box is not None:
+                x0, y0, x1, y1 = box
+                cells[x0 - left:x1 - left, y0 - top:y1 - top] = self.engine.cell_array_in(*box)
+            return cells
+        live = self.live_cells_in(left, top, right, bottom)
+        if live:
+            indices, nums = zip(*live)
+            columns, rows = as_arrays(indices)
+            cells[columns - left, rows - top] = np.array(nums) + 1
+        return cells
+        
+    def density(self, view):
+        """
+        Return a uint8 array with one palette index per screen pixel for a
+        zoomed out view: 0 where the pixel's block of cells is empty, and
+        1 + a colormap key that grows with the share of the block alive.
+        """
+        left, top, _, scale = view
+        columns, rows = self.size
+        if hasattr(self.engine, "populations"):
+            counts = self.engine.populations(left, top, scale, columns, rows)
+        else:
+            _, _, right, bottom = self.camera.box(view)
+            if hasattr(self.engine, "to_array_in"):
+                box = self.board_box(left, top, right, bottom) or (0, 0, 0, 0)
+                xs, ys = np.nonzero(self.engine.to_array_in(*box))
+                xs, ys = xs + box[0], ys + box[1]
             else:
-                if cell_.num_live_neighbors in self.birth_nums:
-                    cell_.alive = True   
-        
-        for a_cell in self.grid.values():
-            a_cell.get_connections(self)
-        connections = defaultdict(set)
-        for cell in [x for x in self.grid.values() if x.alive]:
-            num = len(cell.connections)
-            for c1, c2 in cell.connections:
-                swaps = [((c1[0], c1[1]), (c2[1], c2[0])),
-                              ((c1[1], c1[0]), (c2[0], c2[1])),
-                              ((c1[1], c1[0]), (c2[1], c2[0]))]
-                if not any((s in connections[num] for s in swaps)):
-                    connections[num].add((c1, c2))
-        for c in sorted(connections.keys(), reverse=True):
-            for connection in connections[c]:
-                for i in range(c):
-                    if connection in connections[i]:
-                        connections[i].remove(connection)
-        self.connections = connections
-        
-        
-           
-    def draw(self, surface):
+                xs, ys = as_arrays(index for index, _ in
+                                          self.live_cells_in(left, top, right, bottom))
+            inside = (xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)
+            blocks = (xs[inside] - left) // scale * rows + (ys[inside] - top) // scale
+            counts = np.bincount(blocks, minlength=columns * rows).reshape(columns, rows)
+        area = scale * scale
+        shades = len(self.colormap)
+        return np.minimum((counts * shades + area - 1) // area, shades).astype(np.uint8)
+        
+    def save_pattern(self, path, name=None):
+        """Write every live cell to a pattern file, unless there are none."""
+        columns, rows = as_arrays(index for index, _ in self.live_cells())
+        if len(columns):
+            patternfiles.save(path, columns, rows, self.rule.string, name)
+        
+    def update(self):
+        mark = tools.PROFILER.mark()
+        self.engine.step()
+        mark = tools.PROFILER.record("step", mark)
+        self.generation += 1
+        self.version += 1
         if self.draw_mode == "Lines":
-            for num in self.connections:
-                for c1, c2 in self.connections[num]:
-                    pg.draw.line(surface, self.colormap[num], c1, c2, self.line_weight)
-        elif self.draw_mode == "Squares":
-            for cell in [c for c in self.grid.values() if c.alive]:
-                pg.draw.rect(surface, self.colormap[cell.num_live_neighbors], cell.rect.inflate(-2, -2))
+            self.connections.update(self.engine.changes())
+            mark = tools.PROFILER.record("connections", mark)
+        else:
+            self.connections.stale = True
+        self.history.update()
+        tools.PROFILER.record("history", mark)
+        
+    def skip(self, generations):
+        """
+        If the board is known to be cycling, move the generation counter
+        forward by as many whole periods as fit in generations without
+        stepping, and return how many generations are left to compute.
+        """
+        period = self.history.period
+        if not period:
+            return generations
+        skipped = generations - generations % period
+        if skipped:
+            self.generation += skipped
+            self.version += 1
+            self.history.shift(skipped)
+        return generations - skipped
+        
+    def advance(self, generations):
+        generations = self.skip(generations)
+        if not generations:
+            return
+        if hasattr(self.engine, "advance"):
+            self.engine.advance(generations)
+            self.generation += generations
+            self.version += 1
+            self.connections.stale = True
+            self.history.stale = True
+        else:
+            for _ in range(generations):
+                self.update()
+        
+    def draw(self, surface, snapshot=None):
+        if snapshot is not None and snapshot.density is not None:
+            self.renderer.render_density(surface, snapshot.density)
+        elif snapshot is None and self.camera.zoomed_out:
+            self.renderer.render_density(surface, self.density(self.camera.view))
+        elif self.draw_mode == "Lines":
+            if snapshot is not None:
+                buckets = snapshot.edges or ()
+            else:
+                if self.connections.stale:
+                    self.connections.rebuild()
+                buckets = self.connections.buckets.items()
+            for num, edges in buckets:
+                for a, b in edges:
+                    pg.draw.line(surface, self.colormap[num], self.cell_rect(a).center,
+                                     self.cell_rect(b).center, self.line_weight)
+        elif snapshot is not None:
+            self.renderer.render(surface, snapshot.cell_array, snapshot.view)
+        else:
+            self.renderer.render(surface)
+                
+    def draw_cell(self, surface, index, num):
+        rect = self.cell_rect(index)
+        if self.draw_mode == "Squares":
+            pg.draw.rect(surface, self.colormap[num], rect.inflate(-2, -2))
         elif self.draw_mode == "Circles":
-            for cell in [c for c in self.grid.values() if c.alive]:
-                pg.draw.circle(surface, self.colormap[cell.num_live_neighbors], cell.rect.center, (cell.rect.width//2))
-                
\ No newline at end of file
+            pg.draw.circle(surface, self.colormap[num], rect.center, (rect.width//2))
+            
+    def index_at(self, pos):
+        """Return the index of the cell under screen position pos, on the board or not."""
+        return self.camera.index_at(pos)
+            
+    def indices_in(self, rect):
+        return self.camera.indices_in(rect)
+                
@@ -0,0 +1,326 @@
+"""
+A HashLife engine for Moore-neighborhood rules. The universe is a memoized
+quadtree of canonical nodes, so repeated regions in space and time are only
+ever computed once. That makes it possible to advance a pattern by millions
+of generations in one call.
+"""
+import random
+from collections import defaultdict
+import numpy as np
+
+
+class Node(object):
+    """
+    A square of 2**level cells made of four canonical children. Level 0
+    nodes are single cells.
+    """
+    __slots__ = ("nw", "ne", "sw", "se", "level", "population")
+
+    def __init__(self, nw, ne, sw, se, level, population):
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.level = level
+        self.population = population
+
+
+class HashLifeEngine(object):
+    """
+    The root node is always centered on index (0, 0) and the universe is
+    unbounded. Nodes and results are interned in dicts that are garbage
+    collected down to the nodes reachable from the root once they grow past
+    max_nodes, checked on every uncached successor so a single long jump
+    stays bounded too. Nodes a jump in progress still holds are dropped from
+    the dicts but stay correct; they just stop being shared. If the live
+    universe alone fills more than half of max_nodes, the bound rises to
+    twice its size so collecting doesn't thrash.
+    """
+    def __init__(self, world, max_nodes=500000):
+        if world.staggered:
+            raise ValueError("HashLifeEngine does not support staggered grids")
+        if not world.infinite:
+            raise ValueError("HashLifeEngine only supports infinite grids")
+        self.columns = world.columns
+        self.rows = world.rows
+        self.max_nodes = max_nodes
+        self.limit = max_nodes
+        self.off = Node(None, None, None, None, 0, 0)
+        self.on = Node(None, None, None, None, 0, 1)
+        self.generation = 0
+        self.set_rule(world.rule)
+        self.reset_caches()
+        self.root = self.empty(3)
+
+    def set_rule(self, rule):
+        self.birth, self.survive = rule.lists()
+        if self.birth[0]:
+            raise ValueError("HashLifeEngine does not support birth on 0 neighbors")
+        self.results = {}
+
+    def reset_caches(self):
+        self.nodes = {}
+        self.results = {}
+        self.empties = [self.off]
+
+    def join(self, nw, ne, sw, se):
+        key = nw, ne, sw, se
+        node = self.nodes.get(key)
+        if node is None:
+            population = nw.population + ne.population + sw.population + se.population
+            node = Node(nw, ne, sw, se, nw.level + 1, population)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, level):
+        while len(self.empties) <= level:
+            e = self.empties[-1]
+            self.empties.append(self.join(e, e, e, e))
+        return self.empties[level]
+
+    def expand(self, node):
+        """Return a node one level up with node at its center."""
+        e = self.empty(node.level - 1)
+        return self.join(self.join(e, e, e, node.nw), self.join(e, e, node.ne, e),
+                         self.join(e, node.sw, e, e), self.join(node.se, e, e, e))
+
+    def center(self, node):
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def is_padded(self, node):
+        """True if every live cell lies in the central quarter of node."""
+        inner = (node.nw.se.se.population + node.ne.sw.sw.population +
+                 node.sw.ne.ne.population + node.se.nw.nw.population)
+        return inner == node.population
+
+    def shrink(self):
+        while self.root.level > 3 and self.is_padded(self.root):
+            self.root = self.center(self.root)
+
+    def step_4x4(self, node):
+        """Return the 2x2 center of a level 2 node after one generation."""
+        cells = [[0] * 4 for _ in range(4)]
+        for qx, qy, quad in ((0, 0, node.nw), (2, 0, node.ne),
+                             (0, 2, node.sw), (2, 2, node.se)):
+            for dx, dy, leaf in ((0, 0, quad.nw), (1, 0, quad.ne),
+                                 (0, 1, quad.sw), (1, 1, quad.se)):
+                cells[qy + dy][qx + dx] = leaf.population
+        result = []
+        for y in (1, 2):
+            for x in (1, 2):
+                num = sum(cells[y + dy][x + dx] for dy in (-1, 0, 1)
+                          for dx in (-1, 0, 1)) - cells[y][x]
+                table = self.survive if cells[y][x] else self.birth
+                result.append(self.on if table[num] else self.off)
+        return self.join(*result)
+
+    def successor(self, node, j):
+        """
+        Return the level - 1 node at the center of node advanced by
+        2**min(j, level - 2) generations.
+        """
+        j = min(j, node.level - 2)
+        key = node, j
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if len(self.nodes) + len(self.results) > self.limit:
+            self.collect()
+        if node.population == 0:
+            result = self.empty(node.level - 1)
+        elif node.level == 2:
+            result = self.step_4x4(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            join, successor = self.join, self.successor
+            c1 = successor(nw, j)
+            c2 = successor(join(nw.ne, ne.nw, nw.se, ne.sw), j)
+            c3 = successor(ne, j)
+            c4 = successor(join(nw.sw, nw.se, sw.nw, sw.ne), j)
+            c5 = successor(join(nw.se, ne.sw, sw.ne, se.nw), j)
+            c6 = successor(join(ne.sw, ne.se, se.nw, se.ne), j)
+            c7 = successor(sw, j)
+            c8 = successor(join(sw.ne, se.nw, sw.se, se.sw), j)
+            c9 = successor(se, j)
+            if j < node.level - 2:
+                result = join(join(c1.se, c2.sw, c4.ne, c5.nw),
+                              join(c2.se, c3.sw, c5.ne, c6.nw),
+                              join(c4.se, c5.sw, c7.ne, c8.nw),
+                              join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                result = join(successor(join(c1, c2, c4, c5), j),
+                              successor(join(c2, c3, c5, c6), j),
+                              successor(join(c4, c5, c7, c8), j),
+                              successor(join(c5, c6, c8, c9), j))
+        self.results[key] = result
+        return result
+
+    def advance_power(self, k):
+        """Advance the universe by 2**k generations."""
+        root = self.root
+        while root.level < k + 1 or not self.is_padded(root):
+            root = self.expand(root)
+        root = self.expand(self.expand(root))
+        self.root = self.successor(root, k)
+        self.generation += 1 << k
+        self.shrink()
+        if len(self.nodes) + len(self.results) > self.limit:
+            self.collect()
+
+    def advance(self, generations):
+        """Advance the universe by any number of generations."""
+        k = 0
+        while generations:
+            if generations & 1:
+                self.advance_power(k)
+            generations >>= 1
+            k += 1
+
+    def step(self):
+        self.advance_power(0)
+
+    def changes(self):
+        """Changes are not tracked; None asks callers to rebuild instead."""
+        return None
+
+    def collect(self):
+        """Drop every interned node and result not reachable from the root."""
+        root = self.root
+        self.reset_caches()
+        stack = [root]
+        seen = set()
+        while stack:
+            node = stack.pop()
+            if node.level == 0 or id(node) in seen:
+                continue
+            seen.add(id(node))
+            self.nodes[node.nw, node.ne, node.sw, node.se] = node
+            stack.extend((node.nw, node.ne, node.sw, node.se))
+        self.limit = max(self.max_nodes, 2 * len(self.nodes))
+
+    def half(self, node):
+        return 1 << (node.level - 1)
+
+    def contains(self, node, index):
+        half = self.half(node)
+        return -half <= index[0] < half and -half <= index[1] < half
+
+    def get(self, index):
+        node = self.root
+        if not self.contains(node, index):
+            return False
+        x, y = index[0] + self.half(node), index[1] + self.half(node)
+        while node.level > 0:
+            if not node.population:
+                return False
+            half = self.half(node)
+            west, north = x < half, y < half
+            if north:
+                node = node.nw if west else node.ne
+            else:
+                node = node.sw if west else node.se
+            x, y = x % half, y % half
+        return node.population == 1
+
+    def set_in(self, node, x, y, leaf):
+        if node.level == 0:
+            return leaf
+        half = self.half(node)
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        if y < half:
+            if x < half:
+                nw = self.set_in(nw, x, y, leaf)
+            else:
+                ne = self.set_in(ne, x - half, y, leaf)
+        elif x < half:
+            sw = self.set_in(sw, x, y - half, leaf)
+        else:
+            se = self.set_in(se, x - half, y - half, leaf)
+        return self.join(nw, ne, sw, se)
+
+    def set(self, index, alive):
+        while not self.contains(self.root, index):
+            self.root = self.expand(self.root)
+        half = self.half(self.root)
+        leaf = self.on if alive else self.off
+        self.root = self.set_in(self.root, index[0] + half, index[1] + half, leaf)
+
+    def clear(self):
+        self.root = self.empty(3)
+        self.generation = 0
+
+    def randomize(self):
+        self.clear()
+        for column in range(self.columns):
+            for row in range(self.rows):
+                if random.random() < .5:
+                    self.set((column, row), True)
+
+    def cells_in(self, left, top, right, bottom):
+        """
+        Return the indices of live cells with left <= column < right and
+        top <= row < bottom.
+        """
+        cells = []
+        half = self.half(self.root)
+        stack = [(self.root, -half, -half)]
+        while stack:
+            node, x, y = stack.pop()
+            size = 1 << node.level
+            if (not node.population or x >= right or y >= bottom or
+                    x + size <= left or y + size <= top):
+                continue
+            if node.level == 0:
+                cells.append((x, y))
+            else:
+                half = size // 2
+                stack.extend(((node.nw, x, y), (node.ne, x + half, y),
+                              (node.sw, x, y + half), (node.se, x + half, y + half)))
+        return cells
+
+    def populations(self, left, top, scale, columns, rows):
+        """
+        Return a (columns, rows) array of the number of live cells in each
+        scale x scale block of the box whose top-left cell is (left, top).
+        scale must be a power of two and left and top multiples of it. A
+        node that fits in one block is counted whole, so the cost follows
+        the number of blocks rather than the population.
+        """
+        counts = np.zeros((columns, rows), dtype=np.int64)
+        right, bottom = left + columns * scale, top + rows * scale
+        half = self.half(self.root)
+        stack = [(self.root, -half, -half)]
+        while stack:
+            node, x, y = stack.pop()
+            size = 1 << node.level
+            if (not node.population or x >= right or y >= bottom or
+                    x + size <= left or y + size <= top):
+                continue
+            if size <= scale:
+                counts[(x - left) // scale, (y - top) // scale] += node.population
+            else:
+                half = size // 2
+                stack.extend(((node.nw, x, y), (node.ne, x + half, y),
+                              (node.sw, x, y + half), (node.se, x + half, y + half)))
+        return counts
+
+    def count_live(self, live):
+        counts = defaultdict(int)
+        for x, y in live:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    counts[x + dx, y + dy] += 1
+        return counts
+
+    def live_cells(self):
+        """
+        Return every live cell with its current number of live neighbors.
+        HashLife skips intermediate generations, so the counts describe
+        the current generation rather than the previous one.
+        """
+        half = self.half(self.root)
+        live = self.cells_in(-half, -half, half, half)
+        counts = self.count_live(live)
+        return [(index, counts[index] - 1) for index in live]
+
+    def live_cells_in(self, left, top, right, bottom):
+        """Return live_cells for the cells with left <= column < right and top <= row < bottom only."""
+        counts = self.count_live(self.cells_in(left - 1, top - 1, right + 1, bottom + 1))
+        return [((x, y), counts[x, y] - 1) for x, y in self.cells_in(left, top, right, bottom)]
@@ -0,0 +1,130 @@
+"""
+Spots when a board starts repeating itself. The live state is summarized by
+a Zobrist-style hash, the XOR of a 64-bit key per live cell, so flipping a
+cell is one XOR and a generation costs time proportional to its changes. A
+bounded window of recent hashes turns any repeat into a period.
+"""
+from collections import deque
+import numpy as np
+
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def cell_keys(columns, rows):
+    """
+    Return the uint64 key of every cell in the columns and rows arrays.
+    Keys are a splitmix64 scramble of the index, so any index on an
+    unbounded board has one without a lookup table.
+    """
+    columns = np.asarray(columns, dtype=np.int64).view(np.uint64)
+    rows = np.asarray(rows, dtype=np.int64).view(np.uint64)
+    with np.errstate(over="ignore"):
+        x = (columns << np.uint64(32)) ^ (rows & np.uint64(0xFFFFFFFF))
+        x = x + GOLDEN
+        x = (x ^ (x >> np.uint64(30))) * MIX1
+        x = (x ^ (x >> np.uint64(27))) * MIX2
+        return x ^ (x >> np.uint64(31))
+
+
+def combine(columns, rows):
+    """XOR the keys of the given cells together."""
+    if not len(columns):
+        return 0
+    return int(np.bitwise_xor.reduce(cell_keys(columns, rows)))
+
+
+def as_arrays(indices):
+    """Split an iterable of (column, row) indices into column and row arrays."""
+    indices = np.array(list(indices), dtype=np.int64).reshape(-1, 2)
+    return indices[:, 0], indices[:, 1]
+
+
+class StateHistory(object):
+    """
+    Keeps the hash of the world's live cells up to date and remembers the
+    generation each of the last max_length hashes was seen at. The first
+    time a hash repeats, cycle is set to (period, generation) where
+    generation is the one the repeated state was last seen at. Anything
+    that edits the grid behind the engine's back marks the history stale;
+    the next update rehashes from scratch and forgets the window, since
+    edits break any cycle.
+
+    Tracking is off until enable() is called, since even O(changes)
+    hashing costs more than a step on a big, busy board. Interactive use
+    turns it on; headless runs only pay for it if they ask.
+    """
+    def __init__(self, world, max_length=1024, enabled=False):
+        self.world = world
+        self.max_length = max_length
+        self.enabled = enabled
+        self.hash = 0
+        self.recent = deque()
+        self.seen = {}
+        self.cycle = None
+        self.stale = True
+
+    def enable(self, enabled=True):
+        """Start (or stop) tracking. The hash is rebuilt on the next update."""
+        self.enabled = enabled
+        self.stale = True
+        self.cycle = None
+
+    @property
+    def period(self):
+        return self.cycle[0] if self.cycle else None
+
+    def rehash(self):
+        engine = self.world.engine
+        if hasattr(engine, "to_array"):
+            columns, rows = np.nonzero(engine.to_array())
+        elif hasattr(engine, "cell_array"):
+            columns, rows = np.nonzero(engine.cell_array())
+        else:
+            columns, rows = as_arrays(index for index, _ in self.world.live_cells())
+        self.hash = combine(columns, rows)
+
+    def reset(self):
+        self.rehash()
+        self.recent.clear()
+        self.seen = {}
+        self.cycle = None
+        self.stale = False
+        self.remember()
+
+    def update(self):
+        """Fold the engine's last step into the hash and check for a repeat."""
+        if not self.enabled:
+            return
+        if self.stale:
+            self.reset()
+            return
+        engine = self.world.engine
+        if hasattr(engine, "change_arrays"):
+            self.hash ^= combine(*engine.change_arrays())
+        else:
+            changed = engine.changes()
+            if changed is None:
+                self.rehash()
+            else:
+                self.hash ^= combine(*as_arrays(changed))
+        if self.cycle is None and self.hash in self.seen:
+            start = self.seen[self.hash]
+            self.cycle = self.world.generation - start, start
+        self.remember()
+
+    def remember(self):
+        generation = self.world.generation
+        self.recent.append((self.hash, generation))
+        self.seen[self.hash] = generation
+        if len(self.recent) > self.max_length:
+            old_hash, old_generation = self.recent.popleft()
+            if self.seen.get(old_hash) == old_generation:
+                del self.seen[old_hash]
+
+    def shift(self, generations):
+        """Move every remembered generation forward after the grid skips ahead."""
+        self.recent = deque((h, g + generations) for h, g in self.recent)
+        self.seen = {h: g + generations for h, g in self.seen.items()}
@@ -110,8 +110,7 @@ class ButtonGroup(pg.sprite.Group):
 
 
 class Button(pg.sprite.Sprite, tools._KwargMixin):
-    _invisible = pg.Surface((1,1)).convert_alpha()
-    _invisible.fill((0,0,0,0))
+    _invisible = None
 
     def __init__(self, rect_style, *groups, **kwargs):
         super(Button, self).__init__(*groups)
@@ -182,6 +181,9 @@ class Button(pg.sprite.Sprite, tools._KwargMixin):
         if any(pressed[key] for key in self.bindings):
             hover = True
         if not self.visible:
+            if Button._invisible is None:
+                Button._invisible = pg.Surface((1,1)).convert_alpha()
+                Button._invisible.fill((0,0,0,0))
             self.image = Button._invisible
         elif self.active:
             self.image = (hover and self.hover_image) or self.idle_image
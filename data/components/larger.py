@@ -0,0 +1,78 @@
+"""
+A dense engine for Larger than Life rules, where cells count every live
+cell within a radius rather than just the adjacent eight. Counts are read
+off a summed-area table, so a step costs the same per cell whatever the
+radius.
+"""
+import numpy as np
+from .engines import ArrayEngine
+
+
+def box_sums(table, width):
+    """
+    Given a summed-area table with a leading row and column of zeros,
+    return the sum of every width x width box that fits inside it.
+    """
+    return (table[width:, width:] - table[:-width, width:] -
+               table[width:, :-width] + table[:-width, :-width])
+
+
+def summed_area(padded):
+    """Turn padded into its summed-area table in place and return it."""
+    np.cumsum(padded, axis=0, out=padded)
+    np.cumsum(padded, axis=1, out=padded)
+    return padded
+
+
+class LargerEngine(ArrayEngine):
+    """
+    An ArrayEngine that counts neighbors over the rule's radius. Moore
+    neighborhoods are square boxes, summed straight from a table of the
+    zero-padded board. Von Neumann neighborhoods are diamonds, which turn
+    into boxes when the board is rotated 45 degrees: cell (column, row)
+    goes to (column + row, column - row + rows - 1) of a grid with a hole
+    between every two cells, and is summed from that grid's table. The
+    flat positions of the cells in the rotated grid are worked out once. The
+    rotated grid is about (columns + rows) squared, so large von Neumann
+    boards need more memory than Moore ones. Runs any rule on the square
+    lattice, radius 1 Life-like rules included; the board is bounded.
+    """
+    def __init__(self, world):
+        if world.staggered:
+            raise ValueError("LargerEngine does not support staggered grids")
+        super(LargerEngine, self).__init__(world)
+
+    def set_rule(self, rule):
+        super(LargerEngine, self).set_rule(rule)
+        self.radius = rule.radius
+        self.neighborhood = rule.neighborhood
+        self.middle = rule.middle
+        width = 2 * self.radius + 1
+        if self.neighborhood == "M":
+            shape = self.columns + width, self.rows + width
+            self.rotation = None
+        else:
+            diagonal = self.columns + self.rows - 1
+            shape = diagonal + width, diagonal + width
+            columns, rows = np.meshgrid(np.arange(self.columns), np.arange(self.rows),
+                                                    indexing="ij")
+            u, v = (columns + rows).ravel(), (columns - rows + self.rows - 1).ravel()
+            self.rotation = ((u + self.radius + 1) * shape[1] + v + self.radius + 1,
+                                  u * diagonal + v)
+        self.padded = np.zeros(shape, dtype=np.int32)
+
+    def count_neighbors(self):
+        r = self.radius
+        padded = self.padded
+        padded.fill(0)
+        if self.rotation is None:
+            padded[r + 1:r + 1 + self.columns, r + 1:r + 1 + self.rows] = self.cells
+            counts = box_sums(summed_area(padded), 2 * r + 1)
+        else:
+            into, out_of = self.rotation
+            padded.ravel()[into] = self.cells.ravel()
+            sums = box_sums(summed_area(padded), 2 * r + 1)
+            counts = sums.ravel().take(out_of).reshape(self.cells.shape)
+        if not self.middle:
+            counts -= self.cells
+        self.counts[...] = counts
@@ -0,0 +1,355 @@
+"""
+Reads and writes patterns in the standard RLE, Life 1.06 and Macrocell
+formats. Readers are generators of live (x, y) cells that stream from the
+file, so large patterns never exist as one big string or list.
+"""
+import itertools
+import os
+import re
+import numpy as np
+from .rules import Rule, parse as parse_rule
+
+
+CHUNK_SIZE = 1 << 16
+RLE_TOKEN = re.compile(r"(\d*)([A-Za-z.$!])")
+FORMATS = {".rle": "rle", ".lif": "life106", ".life": "life106", ".mc": "macrocell"}
+
+
+def format_of(path):
+    return FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def file_rule(rule):
+    """
+    Return the Rule a pattern file names, written as "B3/S23", "23/3",
+    "B2/S34H" or in Larger than Life notation (see rules.parse), or None if
+    rule isn't one of them.
+    """
+    if not rule:
+        return None
+    try:
+        return parse_rule(rule)
+    except ValueError:
+        return None
+
+
+def rule_string(birth_nums, survive_nums):
+    return Rule(birth_nums, survive_nums).string
+
+
+def chunked(cells, size=CHUNK_SIZE):
+    """Group an iterable of (x, y) cells into (xs, ys) int64 arrays of up to size cells."""
+    cells = iter(cells)
+    while True:
+        chunk = np.array(list(itertools.islice(cells, size)), dtype=np.int64)
+        if not len(chunk):
+            return
+        yield chunk[:, 0], chunk[:, 1]
+
+
+def read_rle_header(f):
+    """
+    Read the comment and "x = , y = " lines at the top of an RLE file.
+    Return the header as a dict and the first line of the body.
+    """
+    header = {}
+    for line in f:
+        if line.startswith("#N"):
+            header["name"] = line[2:].strip()
+        elif line.startswith("#r"):
+            header["rule"] = line[2:].strip()
+        elif line.startswith("#"):
+            continue
+        elif line.lstrip().startswith("x"):
+            for field in line.split(","):
+                key, _, value = field.partition("=")
+                key, value = key.strip(), value.strip()
+                if key in ("x", "y"):
+                    header[key] = int(value)
+                elif key == "rule":
+                    header["rule"] = value
+        elif line.strip():
+            return header, line
+    return header, ""
+
+
+def read_rle(f):
+    """Yield the live cells of an RLE file. Every state but b (or .) counts as alive."""
+    _, first = read_rle_header(f)
+    x = y = 0
+    carry = ""
+    for chunk in itertools.chain((first,), iter(lambda: f.read(CHUNK_SIZE), "")):
+        text = carry + "".join(chunk.split())
+        end = len(text)
+        while end and text[end - 1].isdigit():
+            end -= 1
+        text, carry = text[:end], text[end:]
+        for count, tag in RLE_TOKEN.findall(text):
+            run = int(count) if count else 1
+            if tag == "!":
+                return
+            elif tag == "$":
+                x, y = 0, y + run
+            elif tag in "b.":
+                x += run
+            else:
+                for column in range(x, x + run):
+                    yield column, y
+                x += run
+
+
+def read_life106(f):
+    """Yield the live cells of a Life 1.06 file."""
+    for line in f:
+        if line.startswith("#") or not line.strip():
+            continue
+        x, y = line.split()[:2]
+        yield int(x), int(y)
+
+
+def read_macrocell_header(f):
+    header = {}
+    for line in f:
+        if line.startswith("#R"):
+            header["rule"] = line[2:].strip()
+        elif line.startswith("#N"):
+            header["name"] = line[2:].strip()
+        elif not line.startswith(("#", "[")):
+            break
+    return header
+
+
+def read_macrocell(f):
+    """
+    Yield the live cells of a Macrocell file. Only the (already compressed)
+    node table is held in memory; cells are generated by walking the tree
+    from the root, which is the last node in the file.
+    """
+    nodes = [None]
+    for line in f:
+        line = line.strip()
+        if not line or line.startswith(("#", "[")):
+            continue
+        if line[0] in ".*$":
+            leaf = []
+            x = y = 0
+            for char in line:
+                if char == "$":
+                    x, y = 0, y + 1
+                else:
+                    if char == "*":
+                        leaf.append((x, y))
+                    x += 1
+            nodes.append(tuple(leaf))
+        else:
+            nodes.append(tuple(int(n) for n in line.split()[:5]))
+    if len(nodes) == 1:
+        return
+    stack = [(len(nodes) - 1, 0, 0)]
+    while stack:
+        number, left, top = stack.pop()
+        node = nodes[number]
+        if not node:
+            continue
+        if isinstance(node[0], tuple):
+            for x, y in node:
+                yield left + x, top + y
+        else:
+            half = 1 << (node[0] - 1)
+            stack.extend(((node[1], left, top), (node[2], left + half, top),
+                          (node[3], left, top + half), (node[4], left + half, top + half)))
+
+
+class PatternFile(object):
+    """
+    A pattern on disk. Only the header is read up front. cells() streams
+    the live cells from the file each time it is called, shifted so the
+    bounding box starts at (0, 0); size is (width, height) of that box.
+    """
+    readers = {"rle": read_rle, "life106": read_life106, "macrocell": read_macrocell}
+
+    def __init__(self, path):
+        self.path = path
+        self.format = format_of(path)
+        if self.format is None:
+            raise ValueError("Unknown pattern format: {}".format(path))
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.rule = None
+        self.origin = None
+        self._size = None
+        with open(path) as f:
+            if self.format == "rle":
+                header = read_rle_header(f)[0]
+                if "x" in header and "y" in header:
+                    self.origin = 0, 0
+                    self._size = header["x"], header["y"]
+            elif self.format == "macrocell":
+                header = read_macrocell_header(f)
+            else:
+                header = {}
+        self.name = header.get("name", self.name)
+        self.rule = header.get("rule")
+        self.mtime = os.path.getmtime(path)
+
+    def raw_cells(self):
+        with open(self.path) as f:
+            for cell in self.readers[self.format](f):
+                yield cell
+
+    def measure(self):
+        left = top = right = bottom = None
+        for xs, ys in chunked(self.raw_cells()):
+            bounds = xs.min(), ys.min(), xs.max(), ys.max()
+            if left is None:
+                left, top, right, bottom = bounds
+            else:
+                left, top = min(left, bounds[0]), min(top, bounds[1])
+                right, bottom = max(right, bounds[2]), max(bottom, bounds[3])
+        if left is None:
+            self.origin, self._size = (0, 0), (0, 0)
+        else:
+            self.origin = int(left), int(top)
+            self._size = int(right - left + 1), int(bottom - top + 1)
+
+    @property
+    def size(self):
+        if self._size is None:
+            self.measure()
+        return self._size
+
+    def cells(self):
+        if self.origin is None:
+            self.measure()
+        left, top = self.origin
+        for x, y in self.raw_cells():
+            yield x - left, y - top
+
+    def matches(self, rule):
+        """
+        True if the pattern's rule is rule, a compiled Rule, lattice
+        included, or the pattern doesn't name one.
+        """
+        named = file_rule(self.rule)
+        return named is None or named == rule
+
+
+def load_directory(directory):
+    """Return a PatternFile for every pattern file in directory, sorted by name."""
+    if not os.path.isdir(directory):
+        return []
+    patterns = []
+    for filename in sorted(os.listdir(directory)):
+        if format_of(filename) is not None:
+            patterns.append(PatternFile(os.path.join(directory, filename)))
+    return patterns
+
+
+def normalize(xs, ys):
+    """Drop repeated cells, sort row by row and shift the cells to start at (0, 0)."""
+    cells = np.stack([np.asarray(ys, dtype=np.int64), np.asarray(xs, dtype=np.int64)], 1)
+    cells = np.unique(cells.reshape(-1, 2), axis=0)
+    ys, xs = cells[:, 0], cells[:, 1]
+    if len(xs):
+        xs, ys = xs - xs.min(), ys - ys.min()
+    return xs, ys
+
+
+def write_rle(f, xs, ys, rule=None, name=None, line_length=70):
+    """Write the cells at xs, ys to f as RLE, shifted to start at (0, 0)."""
+    xs, ys = normalize(xs, ys)
+    width = int(xs.max()) + 1 if len(xs) else 0
+    height = int(ys.max()) + 1 if len(ys) else 0
+    if name:
+        f.write("#N {}\n".format(name))
+    header = "x = {}, y = {}".format(width, height)
+    if rule:
+        header += ", rule = {}".format(rule)
+    f.write(header + "\n")
+    xs, ys = xs.tolist(), ys.tolist()
+    tokens = []
+    x = y = 0
+    i = 0
+    while i < len(xs):
+        if ys[i] > y:
+            tokens.append((ys[i] - y, "$"))
+            x, y = 0, ys[i]
+        if xs[i] > x:
+            tokens.append((xs[i] - x, "b"))
+        run = 1
+        while i + run < len(xs) and ys[i + run] == y and xs[i + run] == xs[i] + run:
+            run += 1
+        tokens.append((run, "o"))
+        x = xs[i] + run
+        i += run
+    tokens.append((1, "!"))
+    line = ""
+    for run, tag in tokens:
+        token = "{}{}".format(run if run > 1 else "", tag)
+        if len(line) + len(token) > line_length:
+            f.write(line + "\n")
+            line = ""
+        line += token
+    f.write(line + "\n")
+
+
+def write_life106(f, xs, ys):
+    f.write("#Life 1.06\n")
+    for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+        f.write("{} {}\n".format(x, y))
+
+
+def write_macrocell(f, xs, ys, rule=None):
+    """
+    Write the cells at xs, ys to f as a Macrocell quadtree. Identical
+    subtrees are written once and shared.
+    """
+    xs, ys = normalize(xs, ys)
+    extent = int(max(xs.max(), ys.max())) + 1 if len(xs) else 1
+    level = 3
+    while (1 << level) < extent:
+        level += 1
+    lines = []
+    numbers = {}
+
+    def build(level, xs, ys):
+        if not len(xs):
+            return 0
+        if level == 3:
+            rows = [["."] * 8 for _ in range(8)]
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                rows[y][x] = "*"
+            key = "$".join("".join(row).rstrip(".") for row in rows).rstrip("$") + "$"
+        else:
+            half = 1 << (level - 1)
+            east, south = xs >= half, ys >= half
+            children = []
+            for s, e in ((False, False), (False, True), (True, False), (True, True)):
+                mask = (east == e) & (south == s)
+                children.append(build(level - 1, xs[mask] - half * e, ys[mask] - half * s))
+            key = "{} {} {} {} {}".format(level, *children)
+        if key not in numbers:
+            lines.append(key)
+            numbers[key] = len(lines)
+        return numbers[key]
+
+    f.write("[M2] (Automata)\n")
+    if rule:
+        f.write("#R {}\n".format(rule))
+    if not build(level, xs, ys):
+        f.write("$\n")
+    for line in lines:
+        f.write(line + "\n")
+
+
+def save(path, xs, ys, rule=None, name=None):
+    """Write the cells to path in the format its extension names."""
+    fmt = format_of(path)
+    with open(path, "w") as f:
+        if fmt == "rle":
+            write_rle(f, xs, ys, rule, name)
+        elif fmt == "life106":
+            write_life106(f, xs, ys)
+        elif fmt == "macrocell":
+            write_macrocell(f, xs, ys, rule)
+        else:
+            raise ValueError("Unknown pattern format: {}".format(path))
@@ -0,0 +1,229 @@
+"""
+Records a run as an animated PNG or a numbered sequence of PNG files.
+Frames are handed to an encoder thread through a bounded queue, so the
+loop that captures them only ever pays for a copy (or nothing at all when
+the frame is an immutable snapshot array). PNG data is written with zlib,
+which releases the GIL while it compresses.
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(kind, data):
+    crc = zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+def png_header(width, height, indexed):
+    """Return the IHDR chunk for 8-bit RGB or palette-indexed pixels."""
+    return png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8,
+                                                          3 if indexed else 2, 0, 0, 0))
+
+
+def png_palette(palette):
+    return png_chunk(b"PLTE", bytes(bytearray(c for color in palette for c in color[:3])))
+
+
+def compress_pixels(pixels, level):
+    """Deflate pixels (rows first, as (height, width) or (height, width, 3)) with no row filters."""
+    height = pixels.shape[0]
+    rows = np.zeros((height, 1 + pixels[0].size), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+    return zlib.compress(rows, level)
+
+
+def fit(pixels, shape):
+    """Crop or pad pixels with zeros to shape, so every frame of an animation is one size."""
+    if pixels.shape == shape:
+        return pixels
+    fitted = np.zeros(shape, dtype=np.uint8)
+    height, width = min(shape[0], pixels.shape[0]), min(shape[1], pixels.shape[1])
+    fitted[:height, :width] = pixels[:height, :width]
+    return fitted
+
+
+class Frame(object):
+    """
+    One captured image: pixels is a uint8 array indexed [y, x], either
+    palette indices with palette a list of 256 RGB tuples, or [y, x, rgb]
+    with palette None.
+    """
+    __slots__ = ("pixels", "palette")
+
+    def __init__(self, pixels, palette=None):
+        self.pixels = pixels
+        self.palette = palette
+
+
+class ApngWriter(object):
+    """
+    Streams frames into an animated PNG. The frame count in the acTL
+    chunk isn't known until the end, so it is written as 0 and patched
+    when the writer is closed. Every frame takes the size, and for
+    indexed frames the palette, of the first.
+    """
+    def __init__(self, path, delay_ms, level):
+        self.path = path
+        self.delay_ms = delay_ms
+        self.level = level
+        self.file = None
+        self.shape = None
+        self.frames = 0
+        self.sequence = 0
+        self.actl_offset = None
+
+    def write(self, frame):
+        pixels = frame.pixels
+        if self.file is None:
+            self.start(pixels, frame.palette)
+        pixels = fit(pixels, self.shape)
+        height, width = self.shape[:2]
+        control = struct.pack(">IIIIIHHBB", self.sequence, width, height, 0, 0,
+                                      self.delay_ms, 1000, 0, 0)
+        self.file.write(png_chunk(b"fcTL", control))
+        self.sequence += 1
+        data = compress_pixels(pixels, self.level)
+        if not self.frames:
+            self.file.write(png_chunk(b"IDAT", data))
+        else:
+            self.file.write(png_chunk(b"fdAT", struct.pack(">I", self.sequence) + data))
+            self.sequence += 1
+        self.frames += 1
+
+    def start(self, pixels, palette):
+        self.shape = pixels.shape
+        self.file = open(self.path, "wb")
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(png_header(pixels.shape[1], pixels.shape[0], palette is not None))
+        self.actl_offset = self.file.tell()
+        self.file.write(png_chunk(b"acTL", struct.pack(">II", 0, 0)))
+        if palette is not None:
+            self.file.write(png_palette(palette))
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.write(png_chunk(b"IEND", b""))
+        self.file.seek(self.actl_offset)
+        self.file.write(png_chunk(b"acTL", struct.pack(">II", self.frames, 0)))
+        self.file.close()
+        self.file = None
+
+
+class SequenceWriter(object):
+    """Writes each frame to its own numbered PNG file in a directory."""
+    def __init__(self, directory, level):
+        self.directory = directory
+        self.level = level
+        self.frames = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, frame):
+        pixels = frame.pixels
+        path = os.path.join(self.directory, "frame-{:06d}.png".format(self.frames))
+        with open(path, "wb") as f:
+            f.write(PNG_SIGNATURE)
+            f.write(png_header(pixels.shape[1], pixels.shape[0], frame.palette is not None))
+            if frame.palette is not None:
+                f.write(png_palette(frame.palette))
+            f.write(png_chunk(b"IDAT", compress_pixels(pixels, self.level)))
+            f.write(png_chunk(b"IEND", b""))
+        self.frames += 1
+
+    def close(self):
+        pass
+
+
+class Recorder(object):
+    """
+    Owns the encoder thread. capture() queues a Frame and returns at once:
+    when max_pending frames are already waiting the new frame is dropped
+    and counted, or, if wait is set, capture blocks until there is room.
+    format is "apng" (path is the file) or "png" (path is a directory for
+    the numbered frames).
+    """
+    def __init__(self, path, format="apng", delay_ms=100, max_pending=32, wait=False,
+                      level=1):
+        self.path = path
+        if format == "apng":
+            self.writer = ApngWriter(path, delay_ms, level)
+        elif format == "png":
+            self.writer = SequenceWriter(path, level)
+        else:
+            raise ValueError("Unknown recording format: {}".format(format))
+        self.frames = queue.Queue(max_pending)
+        self.wait = wait
+        self.captured = 0
+        self.dropped = 0
+        self.stopped = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def written(self):
+        return self.writer.frames
+
+    @property
+    def pending(self):
+        return self.frames.qsize()
+
+    def capture(self, frame):
+        """
+        Queue frame for encoding. Return False if it was dropped, or if
+        the recorder has been stopped, in which case it isn't counted.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.stopped:
+            return False
+        try:
+            self.frames.put(frame, self.wait)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.captured += 1
+        return True
+
+    def skip(self, frames):
+        """Count frames that were never captured, such as generations nobody drew, as dropped."""
+        self.dropped += max(0, frames)
+
+    def stop(self, wait=True):
+        """
+        Stop recording. The encoder finishes whatever is still queued and
+        closes the output. With wait, return (written, dropped) once it
+        has; otherwise return at once and let the encoder finish alone.
+        """
+        self.stopped = True
+        if not wait:
+            threading.Thread(target=self.stop).start()
+            return None
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.written, self.dropped
+
+    def run(self):
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                self.writer.write(frame)
+        except Exception as e:
+            self.error = e
+            while self.frames.get() is not None:
+                pass
+        finally:
+            self.writer.close()
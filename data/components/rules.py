@@ -0,0 +1,197 @@
+"""
+Compiles Life-like rules into transition tables. Rules are written in B/S
+notation ("B36/S23", "b3s23") or the older S/B form ("23/36"). A trailing H
+("B2/S34H") marks a rule for the six-neighbor hexagonal lattice, which is
+what the staggered grids are, and a "Staggered " prefix does the same for
+any rule. Engines step from the compiled table alone, so a rule typed in at
+the menu runs exactly as fast as a built-in one.
+
+Larger than Life rules use Golly's notation, "R5,C0,M1,S34..58,B34..45,NM":
+the radius, the number of states (0 or 2), whether a cell counts itself
+(M), the survive and birth ranges and a Moore (NM) or von Neumann (NN)
+neighborhood.
+"""
+import re
+import numpy as np
+
+
+BS_RULE = re.compile(r"^B(\d*)/?S(\d*)(H?)$", re.I)
+SB_RULE = re.compile(r"^(\d*)/(\d*)(H?)$", re.I)
+LTL_RULE = re.compile(r"^R(\d+),C(\d+),M([01]),S(?:(\d+)\.\.(\d+))?,"
+                                r"B(?:(\d+)\.\.(\d+))?,N([MN])$", re.I)
+STAGGERED = "Staggered "
+MAX_NEIGHBORS = 8
+HEX_NEIGHBORS = 6
+MAX_COUNT = 254
+
+
+def compile_table(birth, survive, max_count=MAX_NEIGHBORS):
+    """
+    Return the (2, max_count + 1) uint8 table whose [alive, count] entry
+    is a cell's next state.
+    """
+    table = np.zeros((2, max_count + 1), dtype=np.uint8)
+    table[0, list(birth)] = 1
+    table[1, list(survive)] = 1
+    return table
+
+
+class Rule(object):
+    """
+    A compiled two-state rule. birth and survive are sorted tuples of
+    neighbor counts; hexagonal rules count the six neighbors of the
+    staggered lattice instead of the eight Moore neighbors.
+    """
+    radius = 1
+    neighborhood = "M"
+    middle = False
+
+    def __init__(self, birth, survive, hexagonal=False):
+        self.birth = tuple(sorted(set(birth)))
+        self.survive = tuple(sorted(set(survive)))
+        self.hexagonal = hexagonal
+        self.table = compile_table(self.birth, self.survive, self.max_count)
+        self.table.setflags(write=False)
+
+    @property
+    def neighbors(self):
+        return HEX_NEIGHBORS if self.hexagonal else MAX_NEIGHBORS
+
+    @property
+    def max_count(self):
+        """The highest count the table covers."""
+        return MAX_NEIGHBORS
+
+    @property
+    def string(self):
+        return "B{}/S{}{}".format("".join(str(n) for n in self.birth),
+                                           "".join(str(n) for n in self.survive),
+                                           "H" if self.hexagonal else "")
+
+    def lists(self):
+        """Return the birth and survive rows of the table as lists of bools, for pure Python lookups."""
+        return self.table.astype(bool).tolist()
+
+    def key(self):
+        return (type(self), self.birth, self.survive, self.hexagonal, self.radius,
+                   self.neighborhood, self.middle)
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.string)
+
+
+def neighborhood_size(radius, neighborhood, middle):
+    """The number of cells a cell counts: a (2r + 1) square or an r step diamond."""
+    if neighborhood == "M":
+        cells = (2 * radius + 1) ** 2
+    else:
+        cells = 2 * radius * (radius + 1) + 1
+    return cells if middle else cells - 1
+
+
+class LargerRule(Rule):
+    """
+    A Larger than Life rule. Cells count the live cells within radius of
+    them, in a square ("M") or diamond ("N") neighborhood, themselves
+    included if middle is set. birth_range and survive_range are inclusive
+    (low, high) counts, or None.
+    """
+    def __init__(self, radius, birth_range, survive_range, neighborhood="M", middle=False):
+        self.radius = radius
+        self.neighborhood = neighborhood
+        self.middle = middle
+        self.birth_range = birth_range
+        self.survive_range = survive_range
+        birth = range(birth_range[0], birth_range[1] + 1) if birth_range else ()
+        survive = range(survive_range[0], survive_range[1] + 1) if survive_range else ()
+        super(LargerRule, self).__init__(birth, survive)
+
+    @property
+    def neighbors(self):
+        return neighborhood_size(self.radius, self.neighborhood, self.middle)
+
+    @property
+    def max_count(self):
+        return self.neighbors
+
+    @property
+    def string(self):
+        def span(counts):
+            return "{}..{}".format(*counts) if counts else ""
+        return "R{},C0,M{},S{},B{},N{}".format(self.radius, int(self.middle),
+                                                          span(self.survive_range),
+                                                          span(self.birth_range),
+                                                          self.neighborhood)
+
+
+def parse_larger(text, match):
+    radius, states, middle = int(match.group(1)), int(match.group(2)), match.group(3) == "1"
+    neighborhood = match.group(8).upper()
+    if states > 2:
+        raise ValueError("{!r} has {} states; only two-state rules are supported".format(
+                                  text, states))
+    if radius < 1:
+        raise ValueError("{!r} needs a radius of at least 1".format(text))
+    limit = neighborhood_size(radius, neighborhood, middle)
+    if limit > MAX_COUNT:
+        raise ValueError("{!r} counts {} cells; at most {} fit the palette".format(
+                                  text, limit, MAX_COUNT))
+    ranges = []
+    for low, high in (match.group(6, 7), match.group(4, 5)):
+        if low is None:
+            ranges.append(None)
+            continue
+        low, high = int(low), int(high)
+        if low > high or high > limit:
+            raise ValueError("{!r}: {}..{} isn't a range of 0..{}".format(text, low, high, limit))
+        ranges.append((low, high))
+    return LargerRule(radius, ranges[0], ranges[1], neighborhood, middle)
+
+
+def parse(text):
+    """
+    Return the Rule written as text, raising ValueError if it isn't a
+    rule or asks for more neighbors than its lattice has.
+    """
+    rule = text.strip()
+    hexagonal = rule.startswith(STAGGERED)
+    if hexagonal:
+        rule = rule[len(STAGGERED):].strip()
+    match = LTL_RULE.match(rule)
+    if match:
+        if hexagonal:
+            raise ValueError("{!r}: Larger than Life rules need a square grid".format(text))
+        return parse_larger(text, match)
+    match = BS_RULE.match(rule)
+    if match:
+        birth, survive, hex_suffix = match.groups()
+    else:
+        match = SB_RULE.match(rule)
+        if not match:
+            raise ValueError("Not a B/S rule: {!r}".format(text))
+        survive, birth, hex_suffix = match.groups()
+    hexagonal = hexagonal or bool(hex_suffix)
+    birth, survive = [int(n) for n in birth], [int(n) for n in survive]
+    limit = HEX_NEIGHBORS if hexagonal else MAX_NEIGHBORS
+    if any(n > limit for n in birth + survive):
+        raise ValueError("{!r} counts more than {} neighbors".format(text, limit))
+    return Rule(birth, survive, hexagonal)
+
+
+def is_staggered(text):
+    """True if text names a rule for the staggered (hexagonal) lattice."""
+    if text.startswith(STAGGERED):
+        return True
+    try:
+        return parse(text).hexagonal
+    except ValueError:
+        return False
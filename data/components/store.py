@@ -0,0 +1,143 @@
+"""
+A compact store for bounded boards that replaces one Cell object per index
+with a few typed arrays. Geometry is never stored: a cell's rect follows
+from its index and the cell size (see AutomataGrid.cell_rect).
+"""
+import itertools
+import numpy as np
+from .. import tools
+
+
+def neighbor_table(columns, rows, moore_offsets, even_offsets, odd_offsets, staggered):
+    """
+    Return an int32 array of shape (num_neighbors, columns * rows) holding
+    the flat index (column * rows + row) of every neighbor of every cell.
+    Neighbors past the edges point at the sentinel index columns * rows.
+    """
+    size = columns * rows
+    flat = np.arange(size, dtype=np.int32)
+    column, row = flat // rows, flat % rows
+    if staggered:
+        odd = (column % 2).astype(bool)
+        offsets = [(np.where(odd, o[0], e[0]), np.where(odd, o[1], e[1]))
+                     for e, o in zip(even_offsets, odd_offsets)]
+    else:
+        offsets = moore_offsets
+    table = np.empty((len(offsets), size), dtype=np.int32)
+    for k, (dx, dy) in enumerate(offsets):
+        x, y = column + dx, row + dy
+        inside = (x >= 0) & (x < columns) & (y >= 0) & (y < rows)
+        table[k] = np.where(inside, x * rows + y, size)
+    return table
+
+
+class CellStore(object):
+    """
+    Holds state, last state and neighbor counts as flat uint8 arrays indexed
+    by column * rows + row. Each state array has one extra always-dead slot
+    at the end that the neighbor table uses for cells past the edges, so a
+    step is one gather and sum over the table followed by a rule lookup.
+    """
+    def __init__(self, world):
+        if world.infinite:
+            raise ValueError("CellStore does not support infinite grids")
+        self.columns = world.columns
+        self.rows = world.rows
+        self.size = self.columns * self.rows
+        self.neighbors = neighbor_table(self.columns, self.rows, world.moore_offsets,
+                                                    world.even_offsets, world.odd_offsets,
+                                                    world.staggered)
+        self.state = np.zeros(self.size + 1, dtype=np.uint8)
+        self.last_state = np.zeros(self.size + 1, dtype=np.uint8)
+        self.counts = np.zeros(self.size, dtype=np.uint8)
+        self.set_rule(world.rule)
+
+    def set_rule(self, rule):
+        self.table = rule.table
+
+    def step(self):
+        self.state, self.last_state = self.last_state, self.state
+        last = self.last_state
+        mark = tools.PROFILER.mark()
+        self.counts.fill(0)
+        for neighbor in self.neighbors:
+            self.counts += last[neighbor]
+        mark = tools.PROFILER.record("neighbors", mark)
+        self.state[:-1] = self.table[last[:-1], self.counts]
+        tools.PROFILER.record("rules", mark)
+
+    def flat_index(self, index):
+        column, row = index
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return column * self.rows + row
+        return None
+
+    def unflatten(self, flat):
+        columns, rows = np.divmod(flat, self.rows)
+        return list(zip(columns.tolist(), rows.tolist()))
+
+    def change_arrays(self):
+        return np.divmod(np.nonzero(self.state != self.last_state)[0], self.rows)
+
+    def changes(self):
+        columns, rows = self.change_arrays()
+        return list(zip(columns.tolist(), rows.tolist()))
+
+    def get(self, index):
+        flat = self.flat_index(index)
+        return flat is not None and bool(self.state[flat])
+
+    def set(self, index, alive):
+        flat = self.flat_index(index)
+        if flat is not None:
+            self.state[flat] = alive
+
+    def set_cells(self, cells, chunk_size=1 << 16):
+        """
+        Set many cells at once from an iterable of (index, alive) pairs,
+        consumed in chunks so long streams never become one big list.
+        """
+        cells = iter(cells)
+        while True:
+            chunk = list(itertools.islice(cells, chunk_size))
+            if not chunk:
+                return
+            indices, alive = zip(*chunk)
+            indices = np.array(indices, dtype=np.int64)
+            columns, rows = indices[:, 0], indices[:, 1]
+            inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+            flat = columns[inside] * self.rows + rows[inside]
+            self.state[flat] = np.array(alive, dtype=np.uint8)[inside]
+
+    def clear(self):
+        self.state.fill(0)
+
+    def randomize(self):
+        self.state[:-1] = np.random.randint(0, 2, self.size)
+
+    def to_array(self):
+        """Return a copy of the board as a dense uint8 array indexed [column, row]."""
+        return self.state[:-1].reshape(self.columns, self.rows).copy()
+
+    def load(self, cells):
+        """Replace the board with a dense array indexed [column, row]."""
+        self.state[:-1] = np.asarray(cells, dtype=bool).ravel()
+
+    def cell_array(self):
+        state = self.state[:-1]
+        cells = np.where(state, self.counts + 1, 0).astype(np.uint8)
+        return cells.reshape(self.columns, self.rows)
+
+    def cell_array_in(self, left, top, right, bottom):
+        """Return cell_array for the cells with left <= column < right and top <= row < bottom of the board only."""
+        state = self.to_array_in(left, top, right, bottom)
+        counts = self.counts.reshape(self.columns, self.rows)[left:right, top:bottom]
+        return np.where(state, counts + 1, 0).astype(np.uint8)
+
+    def to_array_in(self, left, top, right, bottom):
+        """Return the part of the board with left <= column < right and top <= row < bottom."""
+        return self.state[:-1].reshape(self.columns, self.rows)[left:right, top:bottom]
+
+    def live_cells(self):
+        flat = np.nonzero(self.state[:-1])[0]
+        return list(zip(self.unflatten(flat), self.counts[flat].tolist()))
@@ -0,0 +1,81 @@
+"""
+Steps a dense board in parallel. The board is cut into tiles of whole
+columns and a process pool steps every tile of a generation at once,
+reading and writing shared memory.
+"""
+import multiprocessing
+import weakref
+import numpy as np
+from .engines import ArrayEngine, count_moore, count_staggered
+
+
+_shared = {}
+
+
+def attach(buffer, columns, rows):
+    """Pool initializer: map the shared buffer as (current, next, counts) boards."""
+    boards = np.frombuffer(buffer, dtype=np.uint8).reshape(3, columns, rows)
+    _shared["boards"] = boards
+
+
+def shutdown(pool):
+    pool.close()
+    pool.join()
+
+
+def step_tile(task):
+    """
+    Step columns start:stop from board src into board dst. The tile reads
+    one column of halo on each side straight from its neighbors' cells in
+    src, so every tile sees exactly what a whole-board step would.
+    """
+    src, dst, start, stop, table, staggered = task
+    boards = _shared["boards"]
+    cells, counts = boards[src], boards[2]
+    low, high = max(start - 1, 0), min(stop + 1, cells.shape[0])
+    block = cells[low:high]
+    block_counts = np.empty_like(block)
+    if staggered:
+        count_staggered(block, block_counts, low % 2 == 1)
+    else:
+        count_moore(block, block_counts)
+    counts[start:stop] = block_counts[start - low:stop - low]
+    boards[dst][start:stop] = table[cells[start:stop], counts[start:stop]]
+
+
+class TiledEngine(ArrayEngine):
+    """
+    An ArrayEngine whose boards live in one shared buffer and whose steps
+    are split across a pool of worker processes. Results are identical to
+    ArrayEngine's. Call close (or just drop the engine) to shut the pool
+    down; it is closed and joined rather than terminated because forked
+    workers inherit SDL's signal handlers, which swallow SIGTERM.
+    """
+    def __init__(self, world, processes=None, tiles_per_process=4):
+        super(TiledEngine, self).__init__(world)
+        columns, rows = self.columns, self.rows
+        self.buffer = multiprocessing.RawArray("B", 3 * columns * rows)
+        attach(self.buffer, columns, rows)
+        self.boards = _shared.pop("boards")
+        self.current = 0
+        self.cells = self.boards[0]
+        self.previous = self.cells
+        self.counts = self.boards[2]
+        processes = processes or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(processes, attach, (self.buffer, columns, rows))
+        self.finalizer = weakref.finalize(self, shutdown, self.pool)
+        num_tiles = max(1, min(columns, processes * tiles_per_process))
+        edges = np.linspace(0, columns, num_tiles + 1).astype(int)
+        self.tiles = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+    def step(self):
+        src, dst = self.current, 1 - self.current
+        tasks = [(src, dst, start, stop, self.table, self.staggered)
+                 for start, stop in self.tiles]
+        self.pool.map(step_tile, tasks)
+        self.current = dst
+        self.previous = self.boards[src]
+        self.cells = self.boards[dst]
+
+    def close(self):
+        self.finalizer()
@@ -0,0 +1,208 @@
+"""
+Runs an AutomataGrid on a background thread so slow generations never hold
+up event handling or drawing.
+"""
+import queue
+import threading
+import time
+from .. import tools
+from . import checkpoint
+from .recorder import Frame
+
+
+class Snapshot(object):
+    """
+    An immutable copy of everything needed to draw one generation as the
+    camera's view saw it when the snapshot was taken: the visible live
+    cells with their neighbor counts, the renderer's cell array and, in
+    Lines mode, the connection buckets. When the view is zoomed out past a
+    cell per pixel only the density array is filled in. cycle is the
+    grid's detected (period, generation), if any.
+    """
+    __slots__ = ("generation", "version", "view", "cells", "cell_array", "density",
+                 "edges", "cycle")
+
+    def __init__(self, world):
+        self.generation = world.generation
+        self.version = world.version
+        self.cycle = world.history.cycle
+        self.view = view = world.camera.view
+        self.cells = {}
+        self.cell_array = self.density = None
+        if view[3] > 1:
+            self.density = world.density(view)
+        else:
+            self.cell_array = world.view_array(view)
+            left, top = view[0] - 1, view[1] - 1
+            columns, rows = self.cell_array.nonzero()
+            nums = self.cell_array[columns, rows] - 1
+            self.cells = {(column + left, row + top): num for column, row, num in
+                          zip(columns.tolist(), rows.tolist(), nums.tolist())}
+        self.edges = None
+        if world.draw_mode == "Lines" and self.density is None:
+            if world.connections.stale:
+                mark = tools.PROFILER.mark()
+                world.connections.rebuild()
+                tools.PROFILER.record("connections", mark)
+            self.edges = [(num, tuple(edges))
+                          for num, edges in world.connections.buckets.items()]
+
+
+class SimulationWorker(object):
+    """
+    Owns the grid while running. Edits and step requests are queued as
+    commands and applied between generations, in order. Each batch of
+    work ends by publishing a Snapshot into a two slot buffer: the worker
+    fills the back slot and swaps it to the front under a lock, and
+    readers only ever see the front.
+
+    When the grid finds a cycle, on_cycle decides what happens to queued
+    steps: "pause" drops them once, when the cycle is first found, and
+    "skip" jumps the generation counter over whole periods of them.
+
+    While a recorder is attached, the camera's view of every new
+    generation is captured as a frame with one pixel per cell (or per
+    density block) right after it is computed, however few of them get
+    drawn. Generations jumped over are counted as dropped.
+    """
+    def __init__(self, grid, publish_interval=.012, on_cycle="pause"):
+        self.grid = grid
+        self.cell_size = grid.cell_size
+        self.camera = grid.camera
+        self.publish_interval = publish_interval
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        self.buffers = [Snapshot(grid), None]
+        self.pending = 0
+        self.on_cycle = on_cycle
+        self.handled_cycle = grid.history.cycle
+        self.recorder = None
+        self.palette = None
+        self.recorded_generation = None
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.commands.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def snapshot(self):
+        """Return the latest published Snapshot."""
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            return self.buffers[0]
+
+    def send(self, name, *args):
+        self.commands.put((name,) + args)
+
+    def request_steps(self, generations):
+        """Make sure at least this many generations are queued up."""
+        self.send("steps", generations)
+
+    def set_cells(self, cells):
+        """Queue cells, an iterable of (index, alive) pairs consumed on the worker thread."""
+        self.send("set_cells", cells)
+
+    def toggle(self, index):
+        self.send("toggle", index)
+
+    def randomize(self):
+        self.send("randomize")
+
+    def advance(self, generations):
+        self.send("advance", generations)
+
+    def save_checkpoint(self, path, compress=True):
+        """
+        Copy the grid between generations and write the copy to path on a
+        thread of its own, so neither stepping nor drawing waits on the disk.
+        """
+        self.send("save_checkpoint", path, compress)
+
+    def record(self, recorder, palette=None):
+        """Capture every new generation into recorder, indexed with palette, or stop if recorder is None."""
+        self.send("record", recorder, palette)
+
+    def save_pattern(self, path, name=None):
+        self.send("save_pattern", path, name)
+
+    def refresh(self):
+        self.send("refresh")
+
+    def apply(self, command):
+        name, args = command[0], command[1:]
+        if name == "steps":
+            self.pending = max(self.pending, args[0])
+        elif name == "save_checkpoint":
+            checkpoint.capture(self.grid).write_in_background(*args)
+        elif name == "record":
+            self.recorder, self.palette = args
+            self.recorded_generation = None
+        elif name != "refresh":
+            getattr(self.grid, name)(*args)
+
+    def handle_cycle(self):
+        cycle = self.grid.history.cycle
+        if cycle is None:
+            return
+        if self.on_cycle == "skip":
+            self.pending = self.grid.skip(self.pending)
+        elif cycle != self.handled_cycle:
+            self.pending = 0
+        self.handled_cycle = cycle
+
+    def capture(self):
+        grid = self.grid
+        if self.recorder is None or grid.generation == self.recorded_generation:
+            return
+        if self.recorded_generation is not None:
+            self.recorder.skip(grid.generation - self.recorded_generation - 1)
+        self.recorded_generation = grid.generation
+        view = self.camera.view
+        if view[3] > 1:
+            pixels = grid.density(view)
+        else:
+            pixels = grid.view_array(view)[1:-1, 1:-1]
+        self.recorder.capture(Frame(pixels.T, self.palette))
+
+    def publish(self):
+        mark = tools.PROFILER.mark()
+        self.buffers[1] = Snapshot(self.grid)
+        tools.PROFILER.record("snapshot", mark)
+        with self.lock:
+            self.buffers.reverse()
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    command = self.commands.get(not self.pending)
+                except queue.Empty:
+                    command = ("refresh",)
+                while command is not None:
+                    self.apply(command)
+                    try:
+                        command = self.commands.get_nowait()
+                    except queue.Empty:
+                        break
+                else:
+                    return
+                self.capture()
+                start = time.time()
+                while self.pending and time.time() - start < self.publish_interval:
+                    self.handle_cycle()
+                    if self.pending:
+                        self.grid.update()
+                        self.pending -= 1
+                        self.capture()
+                self.publish()
+        except Exception as e:
+            self.error = e
@@ -1,3 +1,4 @@
+import sys
 from . import prepare,tools
 from .states import sim, menu, pattern_menu
 
@@ -7,4 +8,9 @@ def main():
                   "MENU": menu.Menu(),
                   "PATTERNMENU": pattern_menu.PatternMenu()}
     controller.setup_states(states, "MENU")
+    prepare.STARTUP.mark("states")
+    if "--startup-report" in sys.argv:
+        controller.startup = prepare.STARTUP
+    if "--profile" in sys.argv:
+        tools.PROFILER.enabled = True
     controller.main()
@@ -6,14 +6,18 @@ from . import tools
 SCREEN_SIZE = (800, 800)
 ORIGINAL_CAPTION = "Automata"
 
+STARTUP = tools.StartupTimer()
 pg.init()
 os.environ['SDL_VIDEO_CENTERED'] = "TRUE"
 pg.display.set_caption(ORIGINAL_CAPTION)
 SCREEN = pg.display.set_mode(SCREEN_SIZE)
 SCREEN_RECT = SCREEN.get_rect()
+STARTUP.mark("display")
 
 
 FONTS = tools.load_all_fonts(os.path.join("resources", "fonts"))
 MUSIC = tools.load_all_music(os.path.join("resources", "music"))
-SFX   = tools.load_all_sfx(os.path.join("resources", "sound"))
-GFX   = tools.load_all_gfx(os.path.join("resources", "graphics"))
+SFX   = tools.AssetCache(os.path.join("resources", "sound"), pg.mixer.Sound,
+                                   (".wav", ".mp3", ".ogg", ".mdi"))
+GFX   = tools.Atlas(os.path.join("resources", "graphics"))
+STARTUP.mark("assets")
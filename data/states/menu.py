@@ -1,6 +1,8 @@
 import pygame as pg
 from .. import tools, prepare
 from ..components.labels import Label, Button, ButtonGroup
+from ..components.grid import AutomataGrid
+from ..components.rules import is_staggered
 
 
 class Menu(tools._State):
@@ -8,6 +10,11 @@ class Menu(tools._State):
         super(Menu, self).__init__()
         self.screen_rect = prepare.SCREEN.get_rect()
         self.buttons = ButtonGroup()
+        self.rule_text = ""
+        self.rule_chars = "0123456789/,.BSHRCMNbshrcmn"
+        self.max_rule_length = 32
+        self.hint = ("Type a rule such as B36/S23, B2/S34H (staggered) or "
+                         "R5,C0,M1,S34..58,B34..45,NM, then ENTER")
         self.make_buttons()
         
     def make_buttons(self):
@@ -15,12 +22,12 @@ class Menu(tools._State):
                       "Life Without Death", "Seeds", "Gnarl",
                       "Serviettes", "Walled Cities", "Maze",
                       "Maze w/ Mice")    
-        w, h = 250, 65
+        w, h = 250, 58
         cx, cy = self.screen_rect.center
         left1 = cx - (w + 20)
         left2 = cx + 20
         top = 10
-        space = 10
+        space = 8
         style = {
                 "text_color": pg.Color("gray80"),
                 "hover_text_color": pg.Color("gray90"),
@@ -33,7 +40,51 @@ class Menu(tools._State):
             Button((left2, top, w, h), self.buttons, text=s_name, hover_text=s_name,
                       call=self.start_sim, args=s_name, font_size=24, **style)
             top += h + space
-            
+        self.make_rule_entry(left1, left2, top + 4, w, style)
+
+    def make_rule_entry(self, left1, left2, top, w, style):
+        """A box for typing a custom rule, with buttons to run it on either lattice."""
+        button_width = 110
+        right = left2 + w
+        self.rule_box = pg.Rect(left1, top, right - left1 - 2 * (button_width + 10), 50)
+        self.rule_label = Label(None, 26, "", "gray90", {"midleft": (left1 + 10, top + 25)})
+        left = self.rule_box.right + 10
+        Button((left, top, button_width, 50), self.buttons, text="Run", hover_text="Run",
+                  call=self.start_custom, args="square", **style)
+        Button((left + button_width + 10, top, button_width, 50), self.buttons, text="Staggered",
+                  hover_text="Staggered", call=self.start_custom, args="staggered",
+                  font_size=24, **style)
+        self.message = Label(None, 22, self.hint, "gray60",
+                                       {"midtop": (self.screen_rect.centerx, top + 60)})
+        self.set_rule_text(self.rule_text)
+
+    def set_rule_text(self, text):
+        self.rule_text = text
+        self.rule_label.set_text("Rule: {}_".format(text))
+        while self.rule_label.rect.right > self.rule_box.right - 6:
+            self.rule_label.set_text("Rule: ...{}_".format(text[-len(text) + 1:]))
+            text = text[1:]
+
+    def show_message(self, text, color="gray60"):
+        self.message.color = pg.Color(color)
+        self.message.set_text(text)
+
+    def start_custom(self, lattice):
+        """
+        Start the typed rule on the "square" or "staggered" lattice, or say
+        why it can't be run. Rules ending in H always run staggered.
+        """
+        rule = self.rule_text.strip()
+        if lattice == "staggered" and not is_staggered(rule):
+            rule = "Staggered {}".format(rule)
+        try:
+            compiled = AutomataGrid.compile_rule(rule, is_staggered(rule))
+        except ValueError as e:
+            self.show_message(str(e), "firebrick1")
+            return
+        self.show_message(self.hint)
+        self.start_sim(compiled.string)
+
     def start_sim(self, rule):
         self.persist["rule"] = rule
         self.persist["pattern"] = None
@@ -52,6 +103,14 @@ class Menu(tools._State):
         elif (event.type == pg.KEYUP and 
               event.key == pg.K_ESCAPE):
             self.quit = True
+        elif event.type == pg.KEYDOWN:
+            if event.key == pg.K_BACKSPACE:
+                self.set_rule_text(self.rule_text[:-1])
+            elif event.key in (pg.K_RETURN, pg.K_KP_ENTER):
+                self.start_custom("square")
+            elif (event.unicode and event.unicode in self.rule_chars and
+                      len(self.rule_text) < self.max_rule_length):
+                self.set_rule_text(self.rule_text + event.unicode.upper())
         
     def update(self, keys, dt):
         self.buttons.update(pg.mouse.get_pos())
@@ -59,6 +118,10 @@ class Menu(tools._State):
     def draw(self, surface):
         surface.fill(pg.Color("black"))
         self.buttons.draw(surface)
+        pg.draw.rect(surface, pg.Color("gray20"), self.rule_box)
+        pg.draw.rect(surface, pg.Color("gray50"), self.rule_box, 2)
+        self.rule_label.draw(surface)
+        self.message.draw(surface)
        
     
 
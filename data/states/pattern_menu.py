@@ -1,49 +1,168 @@
-from collections import deque
+import os
+import math
+import numpy as np
 import pygame as pg
 from .. import tools, prepare
 from ..components.seeds import PATTERNS
 from ..components.labels import Label, Button, ButtonGroup
+from ..components.patternfiles import PatternFile, chunked, format_of
+
+
+PATTERN_DIRECTORY = os.path.join("resources", "patterns")
+PATTERN_FILES = {}
+BITMAPS = tools.LRUCache(256)
+PREVIEWS = tools.LRUCache(1024)
+
+
+def load_pattern_files(rule):
+    """
+    Return the PatternFiles in PATTERN_DIRECTORY that fit rule. Files
+    are only re-read when they change.
+    """
+    if not os.path.isdir(PATTERN_DIRECTORY):
+        return []
+    found = []
+    for filename in sorted(os.listdir(PATTERN_DIRECTORY)):
+        path = os.path.join(PATTERN_DIRECTORY, filename)
+        if format_of(path) is None:
+            continue
+        pattern_file = PATTERN_FILES.get(path)
+        if pattern_file is None or pattern_file.mtime != os.path.getmtime(path):
+            pattern_file = PATTERN_FILES[path] = PatternFile(path)
+        if pattern_file.matches(rule):
+            found.append(pattern_file)
+    return found
+
+
+def variant_bitmap(bitmap, variant):
+    """
+    Return bitmap (indexed [x, y]) as one of its 8 symmetries: mirrored
+    left to right if variant >= 4, then turned variant % 4 quarter turns
+    clockwise.
+    """
+    if variant >= 4:
+        bitmap = bitmap[::-1]
+    return np.rot90(bitmap, variant % 4)
+
+
+def variant_mapper(width, height, variant):
+    """Return a function mapping (x, y) in a width x height box the way variant_bitmap does."""
+    right, bottom = width - 1, height - 1
+    mirror = variant >= 4
+    turns = variant % 4
+    if turns % 2:
+        right, bottom = bottom, right
+    turn = [lambda x, y: (x, y),
+               lambda x, y: (right - y, x),
+               lambda x, y: (right - x, bottom - y),
+               lambda x, y: (y, bottom - x)][turns]
+    if not mirror:
+        return turn
+    flip_right = width - 1
+    return lambda x, y: turn(flip_right - x, y)
+
+
+def bitmap_surface(bitmap, size):
+    """Draw a bool bitmap as white size x size squares on a colorkeyed black surface."""
+    pixels = np.repeat(np.repeat(bitmap, size, 0), size, 1).astype(np.uint8) * 255
+    surf = pg.surfarray.make_surface(np.dstack((pixels, pixels, pixels)))
+    surf.set_colorkey((0, 0, 0))
+    return surf
+
+
+def shrink_bitmap(bitmap, limit):
+    """
+    Return bitmap cut down to at most limit cells a side by merging square
+    blocks of cells; a block is live if any cell in it is.
+    """
+    step = -(-max(bitmap.shape) // limit)
+    if step <= 1:
+        return bitmap
+    width, height = bitmap.shape
+    padded = np.zeros((-(-width // step) * step, -(-height // step) * step), dtype=bool)
+    padded[:width, :height] = bitmap
+    return padded.reshape(padded.shape[0] // step, step, -1, step).any(axis=(1, 3))
 
 
 class Pattern(object):
+    """
+    A pattern from seeds.PATTERNS ready to be placed on the grid. Nothing
+    is drawn up front: preview surfaces for each of the 8 rotations and
+    reflections are made on first use and kept in PREVIEWS, which outlives
+    the menu, so reopening the menu or turning a pattern is a lookup.
+    Previews are at most max_surface pixels a side; a bigger one is drawn
+    smaller and only its part on the screen is scaled up when drawn.
+    """
+    thumbnail_size = 96
+    max_surface = 2048
+    
     def __init__(self, charmap, cell_size):
+        self.charmap = charmap
+        self.key = tuple(charmap)
         self.cell_size = cell_size
         self.cells_wide = len(charmap[0])
         self.cells_tall = len(charmap)
-        self.make_rotations(charmap)
+        self.variant = 0
         self.active = True
-        self.current_rotation = self.rotations[0]
-        self.make_surface()
-        
-        
-    def make_surface(self):    
-        size = self.cell_size
-        self.surf = pg.Surface((len(self.current_rotation[0]) *  size, 
-                                       len(self.current_rotation) * size)).convert_alpha()
-        self.surf.fill((0,0,0,0))
-        for y, row in enumerate(self.current_rotation):
-            for x, char in enumerate(row):
-                if char == "X":
-                    pg.draw.rect(self.surf, pg.Color("white"),
-                                      (x * size, y * size, size, size))
-                                              
-        
-    def make_rotations(self, charmap):
-        new_rows = []
-        rows = charmap
-        for i in range(self.cells_wide):
-            new_rows.append("".join((row[i] for row in rows)))
-        rt90 = new_rows
-        rt180 = [row[::-1] for row in rows]
-        rt270 = [r[::-1] for r in rt90]
-        self.rotations = deque([charmap, rt90, rt180, rt270])
+        
+    def make_bitmap(self):
+        return np.array([[char == "X" for char in row] for row in self.charmap]).T
+        
+    def get_bitmap(self):
+        return BITMAPS.get(self.key, self.make_bitmap)
+        
+    @property
+    def preview_cell_size(self):
+        """Pixels a side for each bitmap cell in the preview."""
+        return self.cell_size
+        
+    def make_surface(self):
+        bitmap = variant_bitmap(self.get_bitmap(), self.variant)
+        size = min(self.preview_cell_size, max(1, self.max_surface // max(bitmap.shape)))
+        return bitmap_surface(bitmap, size)
+        
+    @property
+    def surf(self):
+        return PREVIEWS.get((self.key, self.cell_size, self.variant), self.make_surface)
+        
+    def make_thumbnail(self):
+        """
+        Draw the bitmap at one pixel per cell, after merging cells if it is
+        bigger than the thumbnail, and scale that to the thumbnail size. The
+        full size preview is never made.
+        """
+        bitmap = self.get_bitmap()
+        width, height = [n * self.preview_cell_size for n in bitmap.shape]
+        scale = min(1., float(self.thumbnail_size) / max(width, height))
+        size = max(1, int(width * scale)), max(1, int(height * scale))
+        surf = bitmap_surface(shrink_bitmap(bitmap, self.thumbnail_size), 1)
+        thumbnail = pg.transform.scale(surf, size)
+        thumbnail.set_colorkey((0, 0, 0))
+        return thumbnail
+        
+    @property
+    def rect(self):
+        """The screen rect the preview covers at full size."""
+        width, height = self.get_bitmap().shape
+        if self.variant % 2:
+            width, height = height, width
+        size = self.preview_cell_size
+        return pg.Rect(self.topleft, (width * size, height * size))
+        
+    @property
+    def thumbnail(self):
+        return PREVIEWS.get((self.key, self.cell_size, "thumbnail"), self.make_thumbnail)
     
     def add_to_grid(self, grid):
         tl = self.topleft_index
-        for x in range(len(self.current_rotation[0])):
-            for y in range(len(self.current_rotation)):
+        bitmap = variant_bitmap(self.get_bitmap(), self.variant)
+        width, height = bitmap.shape
+        cells = []
+        for x in range(width):
+            for y in range(height):
                 indx = tl[0] + x, tl[1] + y
-                grid.grid[indx].alive = self.current_rotation[y][x] == "X"
+                cells.append((indx, bool(bitmap[x, y])))
+        grid.set_cells(cells)
         self.active = False
         
     def get_event(self, event, grid):
@@ -57,24 +176,87 @@ class Pattern(object):
         elif event.type == pg.KEYUP:
             if self.active:
                 if event.key == pg.K_LEFT:
-                    self.rotations.rotate(-1)
-                    self.current_rotation = self.rotations[0]
-                    self.make_surface()
+                    self.rotate(-1)
                 if event.key == pg.K_RIGHT:
-                    self.rotations.rotate(1)
-                    self.current_rotation = self.rotations[0]
-                    self.make_surface()
+                    self.rotate(1)
+                if event.key == pg.K_f:
+                    self.variant = (self.variant + 4) % 8
+                    
+    def rotate(self, step):
+        self.variant = (self.variant // 4) * 4 + (self.variant + step) % 4
                     
     def update(self, grid):
-        cell_size = grid.cell_size
-        mx, my = pg.mouse.get_pos()
-        cell_index = mx // cell_size, my // cell_size
+        camera = grid.camera
+        self.cell_size = camera.view[2]
+        cell_index = camera.index_at(pg.mouse.get_pos())
         self.topleft_index = cell_index
-        self.topleft = cell_index[0] * self.cell_size, cell_index[1] *  self.cell_size
+        self.topleft = camera.cell_rect(cell_index).topleft
                         
     def draw(self, surface):
-        if self.active:
-            surface.blit(self.surf, self.topleft)
+        if not self.active:
+            return
+        surf = self.surf
+        rect = self.rect
+        if rect.size == surf.get_size():
+            surface.blit(surf, rect)
+            return
+        visible = rect.clip(surface.get_rect())
+        if not visible:
+            return
+        scale_x = float(surf.get_width()) / rect.width
+        scale_y = float(surf.get_height()) / rect.height
+        left = int((visible.left - rect.left) * scale_x)
+        top = int((visible.top - rect.top) * scale_y)
+        right = min(surf.get_width(), int(math.ceil((visible.right - rect.left) * scale_x)))
+        bottom = min(surf.get_height(), int(math.ceil((visible.bottom - rect.top) * scale_y)))
+        part = surf.subsurface((left, top, right - left, bottom - top))
+        part = pg.transform.scale(part, (int(round((right - left) / scale_x)),
+                                                      int(round((bottom - top) / scale_y))))
+        part.set_colorkey((0, 0, 0))
+        surface.blit(part, (rect.left + int(round(left / scale_x)),
+                                  rect.top + int(round(top / scale_y))))
+            
+            
+class FilePattern(Pattern):
+    """
+    A Pattern read from a PatternFile. Cells are streamed from the file
+    when the pattern is placed and never held as strings. Previews come
+    from a downsampled bitmap of at most max_preview cells a side, made
+    once per file.
+    """
+    max_preview = 100
+    
+    def __init__(self, pattern_file, cell_size):
+        self.pattern_file = pattern_file
+        self.key = "file", pattern_file.path, pattern_file.mtime
+        self.cell_size = cell_size
+        self.cells_wide, self.cells_tall = pattern_file.size
+        self.scale = max(1, -(-max(self.cells_wide, self.cells_tall) // self.max_preview))
+        self.variant = 0
+        self.active = True
+        
+    def make_bitmap(self):
+        scale = self.scale
+        bitmap = np.zeros((max(1, -(-self.cells_wide // scale)),
+                                   max(1, -(-self.cells_tall // scale))), dtype=bool)
+        for xs, ys in chunked(self.pattern_file.cells()):
+            bitmap[xs // scale, ys // scale] = True
+        return bitmap
+            
+    @property
+    def preview_cell_size(self):
+        return self.cell_size * self.scale
+        
+    def cells(self):
+        """Stream the live cells of the current variant."""
+        turn = variant_mapper(self.cells_wide, self.cells_tall, self.variant)
+        for x, y in self.pattern_file.cells():
+            yield turn(x, y)
+            
+    def add_to_grid(self, grid):
+        left, top = self.topleft_index
+        grid.set_cells(((left + x, top + y), True) for x, y in self.cells())
+        self.active = False
             
             
 class PatternMenu(tools._State):
@@ -85,18 +267,22 @@ class PatternMenu(tools._State):
         
     def startup(self, persistent):
         self.persist = persistent
-        cell_size = self.persist["grid"].cell_size
+        grid = self.persist["grid"]
+        cell_size = grid.cell_size
         rule = self.persist["rule"]
-        stills = PATTERNS[rule]["Still Lifes"]
-        oscillators = PATTERNS[rule]["Oscillators"]
-        ships = PATTERNS[rule]["Spaceships"]
-        methuselas = PATTERNS[rule]["Methuselas"]
-        guns = PATTERNS[rule]["Guns"]
+        builtins = PATTERNS.get(rule, {})
+        stills = builtins.get("Still Lifes", [])
+        oscillators = builtins.get("Oscillators", [])
+        ships = builtins.get("Spaceships", [])
+        methuselas = builtins.get("Methuselas", [])
+        guns = builtins.get("Guns", [])
         self.stills = [Pattern(still, cell_size) for still in stills]
         self.oscillators = [Pattern(oscillator, cell_size) for oscillator in oscillators]
         self.ships = [Pattern(ship, cell_size) for ship in ships]
         self.methuselas = [Pattern(methusela, cell_size) for methusela in methuselas]
         self.guns = [Pattern(gun, cell_size) for gun in guns]
+        self.loaded = [FilePattern(pattern_file, cell_size) for pattern_file in
+                              load_pattern_files(grid.rule)]
         self.make_menu()
         
     def choose_pattern(self, pattern):
@@ -116,19 +302,20 @@ class PatternMenu(tools._State):
         element_space = 20
         titles_to_patterns = [("Still Lifes", self.stills), ("Oscillators", self.oscillators),
                                       ("Spaceships", self.ships), ("Methuselas", self.methuselas),
-                                      ("Guns", self.guns)]
+                                      ("Guns", self.guns), ("Loaded", self.loaded)]
         for title, patterns in titles_to_patterns:
             if patterns:
                 label = Label(self.font, 24, title, pg.Color("gray80"), {"topleft": (left, top)})
                 self.labels.append(label)
                 top += label.rect.height + title_space            
                 for p in patterns:
-                    if left + p.surf.get_width() > self.screen_rect.right:
+                    thumbnail = p.thumbnail
+                    if left + thumbnail.get_width() > self.screen_rect.right:
                         left = 20
                         top += line_space
-                    Button(((left, top), p.surf.get_size()), self.buttons, idle_image=p.surf,
+                    Button(((left, top), thumbnail.get_size()), self.buttons, idle_image=thumbnail,
                               call=self.choose_pattern, args=p)
-                    left += p.surf.get_width() + element_space
+                    left += thumbnail.get_width() + element_space
                 top += group_space + line_space
                 left = 20
         instruct1 = Label(self.font, 16, "Left-click to select a pattern", pg.Color("gray80"),
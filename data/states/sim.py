@@ -1,9 +1,21 @@
-import random
+import os
+import numpy as np
 import pygame as pg
 from .. import tools, prepare
 from ..components.grid import AutomataGrid
+from ..components.rules import is_staggered
 from ..components.labels import Button, ButtonGroup
 from ..components.seeds import PATTERNS
+from ..components.worker import SimulationWorker
+from ..components.brush import Brush
+from ..components import checkpoint
+from ..components.recorder import Recorder, Frame
+from .pattern_menu import PATTERN_DIRECTORY, load_pattern_files
+
+
+CHECKPOINT_DIRECTORY = os.path.join("resources", "checkpoints")
+RECORDING_DIRECTORY = os.path.join("resources", "recordings")
+
 
 class Sim(tools._State):
     def __init__(self):
@@ -13,8 +25,27 @@ class Sim(tools._State):
         self.tick_length = 500
         self.min_tick_length = 20
         self.max_tick_length = 1000
+        self.jump_length = 1024
+        self.cycle_action = "pause"
+        self.cycle = None
+        self.turbo = False
+        self.turbo_budget = 12
+        self.generations_per_frame = 64
+        self.max_generations_per_frame = 4096
+        self.rate_timer = 0
+        self.rate_mark = 0
+        self.generations_per_second = 0
         self.timer = 0
         self.running = False
+        self.max_dirty_rects = 400
+        self.brush = Brush()
+        self.brush_keys = {pg.K_1: "pen", pg.K_2: "eraser", pg.K_3: "line", pg.K_4: "rect"}
+        self.zoom_keys = {pg.K_EQUALS: 1, pg.K_PLUS: 1, pg.K_MINUS: -1}
+        self.panning = False
+        self.recorder = None
+        self.record_source = "screen"
+        self.record_delay = 100
+        self.recorded_generation = None
 
     def make_buttons(self):
         self.buttons = ButtonGroup()
@@ -23,7 +54,8 @@ class Sim(tools._State):
         Button((0, 50, 100, 40), self.buttons, idle_image=prepare.GFX["random-button"], 
                   hover_image=prepare.GFX["random-button-solid"], call=self.randomize,
                   bindings=(pg.K_r,))
-        if self.rule_name in PATTERNS:
+        if (self.rule_name in PATTERNS or
+                load_pattern_files(self.grid.rule)):
             Button((0, 100, 100, 40), self.buttons, idle_image=prepare.GFX["pattern-button"], 
                       hover_image=prepare.GFX["pattern-button-solid"], call=self.pick_pattern,
                       bindings=(pg.K_p,))
@@ -50,9 +82,12 @@ class Sim(tools._State):
             
     def change_draw_style(self, draw_style):
         self.grid.draw_mode = draw_style
+        self.worker.refresh()
+        self.redraw = True
         
     def change_palette(self, palette_name):
-        self.grid.colormap = self.grid.colors[palette_name]
+        self.grid.set_palette(palette_name)
+        self.redraw = True
         
     def pick_pattern(self, *args):
         self.done = True
@@ -66,17 +101,145 @@ class Sim(tools._State):
         self.done = True
         
     def randomize(self, *args):
-        for cell in self.grid.grid.values():
-            cell.alive = random.choice((True, False))
+        self.worker.randomize()
     
     def toggle_running(self):
         self.running = not self.running
+        self.redraw = True
+        
+    def toggle_turbo(self):
+        self.turbo = not self.turbo
+        self.set_caption()
+        
+    def toggle_cycle_action(self):
+        self.cycle_action = "skip" if self.cycle_action == "pause" else "pause"
+        self.worker.on_cycle = self.cycle_action
+        self.set_caption()
+        
+    def check_cycle(self):
+        """Report a newly found cycle and pause if that's what's wanted."""
+        cycle = self.worker.snapshot().cycle
+        if cycle != self.cycle:
+            self.cycle = cycle
+            if cycle is not None and self.running and self.cycle_action == "pause":
+                self.toggle_running()
+            self.set_caption()
+        
+    def export_pattern(self):
+        """
+        Save every live cell as an RLE file in the patterns folder. The
+        file is written on the worker thread, which owns the whole board.
+        """
+        if not os.path.isdir(PATTERN_DIRECTORY):
+            os.makedirs(PATTERN_DIRECTORY)
+        name = "{} gen {}".format(self.rule_name, self.worker.snapshot().generation)
+        filename = "".join(c for c in name.lower() if c.isalnum() or c == " ")
+        path = os.path.join(PATTERN_DIRECTORY, filename.replace(" ", "-") + ".rle")
+        self.worker.save_pattern(path, name)
+        
+    def save_checkpoint(self):
+        """Save the whole grid to the checkpoints folder without waiting for the write."""
+        if not os.path.isdir(CHECKPOINT_DIRECTORY):
+            os.makedirs(CHECKPOINT_DIRECTORY)
+        name = "{} gen {}".format(self.rule_name, self.worker.snapshot().generation)
+        filename = "".join(c for c in name.lower() if c.isalnum() or c == " ")
+        path = os.path.join(CHECKPOINT_DIRECTORY, filename.replace(" ", "-") + ".ckpt")
+        self.worker.save_checkpoint(path)
+        
+    def load_checkpoint(self):
+        """Replace the grid with the newest saved checkpoint, whatever its rule."""
+        path = checkpoint.latest(CHECKPOINT_DIRECTORY)
+        if path is None:
+            return
+        grid = checkpoint.load(path).make_grid()
+        self.worker.stop()
+        self.persist["grid"] = grid
+        self.persist["rule"] = grid.sim_name
+        self.persist["pattern"] = None
+        self.startup(self.persist)
+        
+    def toggle_recording(self):
+        """Start recording an animated PNG of each new generation, or finish the current one."""
+        if self.recorder is None:
+            if not os.path.isdir(RECORDING_DIRECTORY):
+                os.makedirs(RECORDING_DIRECTORY)
+            name = "{} gen {} {}".format(self.rule_name, self.worker.snapshot().generation,
+                                                   self.record_source)
+            filename = "".join(c for c in name.lower() if c.isalnum() or c == " ")
+            path = os.path.join(RECORDING_DIRECTORY, filename.replace(" ", "-") + ".png")
+            self.recorder = Recorder(path, delay_ms=self.record_delay)
+            self.recorded_generation = None
+            self.attach_recorder()
+        else:
+            self.stop_recording()
+        self.set_caption()
+        
+    def attach_recorder(self):
+        """Have the worker capture every generation's cells, if that is what is being recorded."""
+        if self.recorder is None or self.record_source != "cells":
+            return
+        palette = [(0, 0, 0)] * 256
+        for num, color in self.grid.colormap.items():
+            palette[num + 1] = tuple(color)[:3]
+        self.worker.record(self.recorder, palette)
+        
+    def stop_recording(self, wait=False):
+        if self.recorder is not None:
+            if self.record_source == "cells":
+                self.worker.record(None)
+            self.recorder.stop(wait)
+            self.recorder = None
+        
+    def toggle_record_source(self):
+        if self.recorder is None:
+            self.record_source = "cells" if self.record_source == "screen" else "screen"
+            self.set_caption()
+        
+    def record_frame(self, surface):
+        """
+        Hand the recorder a copy of the screen just drawn if it shows a new
+        generation. Generations that were never drawn, as in turbo mode or
+        after a jump, are counted as dropped. Cell recordings are captured
+        by the worker instead.
+        """
+        snapshot = self.snapshot
+        if (self.recorder is None or self.record_source != "screen" or
+                snapshot.generation == self.recorded_generation):
+            return
+        if self.recorded_generation is not None:
+            self.recorder.skip(snapshot.generation - self.recorded_generation - 1)
+        self.recorded_generation = snapshot.generation
+        width, height = surface.get_size()
+        pixels = np.frombuffer(pg.image.tostring(surface, "RGB"), dtype=np.uint8)
+        self.recorder.capture(Frame(pixels.reshape(height, width, 3)))
+        
+    def move_camera(self, move, *args):
+        """Call one of the camera's methods and have the worker draw the new view."""
+        view = self.grid.camera.view
+        move(*args)
+        if self.grid.camera.view != view:
+            self.worker.refresh()
+            self.redraw = True
         
     def set_caption(self):
-        birth = "".join((str(x) for x in self.grid.birth_nums))
-        survive = "".join((str(x) for x in self.grid.survive_nums))
-        cap = "{} B{}/S{}  Tick Length: {}ms".format(
-                  self.rule_name,birth, survive, self.tick_length)
+        rule = self.grid.rule.string
+        if rule != self.rule_name:
+            rule = "{} {}".format(self.rule_name, rule)
+        if self.turbo:
+            cap = "{}  Turbo: {} gens/frame  {:.0f} gens/sec".format(
+                      rule, self.generations_per_frame, self.generations_per_second)
+        else:
+            cap = "{}  Tick Length: {}ms  Brush: {}".format(
+                      rule, self.tick_length, self.brush.mode)
+        if self.cycle is not None:
+            cap += "  Period {} cycle at gen {} ({})".format(self.cycle[0], self.cycle[1],
+                                                                        self.cycle_action)
+        if self.recorder is not None:
+            cap += "  REC {}: {} frames, {} dropped".format(self.record_source,
+                                                                         self.recorder.captured,
+                                                                         self.recorder.dropped)
+        elif self.record_source != "screen":
+            cap += "  Record: {}".format(self.record_source)
         pg.display.set_caption(cap)
         
     def startup(self, persistent):
@@ -85,20 +248,39 @@ class Sim(tools._State):
         rule_name = self.persist["rule"]
         self.rule_name = rule_name
         w, h = self.screen_rect.size
-        staggered = "Staggered" in rule_name
+        staggered = is_staggered(rule_name)
         if self.persist["grid"] is None:
             self.grid = AutomataGrid(w, h, self.cell_size, rule_name, staggered=staggered)
         else:
             self.grid = self.persist["grid"]
+        if not self.grid.history.enabled:
+            self.grid.history.enable()
+        self.worker = SimulationWorker(self.grid, self.turbo_budget / 1000.,
+                                                      self.cycle_action)
+        self.cycle = self.grid.history.cycle
+        self.worker.start()
+        self.attach_recorder()
         self.make_buttons()
         
         self.set_caption()
         self.pattern = self.persist["pattern"]
+        self.rate_timer = 0
+        self.rate_mark = self.grid.generation
+        self.redraw = True
+        self.drawn_cells = {}
+        self.drawn_images = {}
+        self.drawn_pattern = None
+        self.drawn_preview = self.brush.preview
+        
+    def cleanup(self):
+        self.stop_recording()
+        self.worker.stop()
+        return super(Sim, self).cleanup()
         
     def get_event(self, event):
         self.buttons.get_event(event)
         if self.pattern is not None:
-            self.pattern.get_event(event, self.grid)
+            self.pattern.get_event(event, self.worker)
         if event.type == pg.QUIT:
             self.quit = True
         elif event.type == pg.KEYUP:
@@ -106,46 +288,208 @@ class Sim(tools._State):
                 self.quit = True
             elif event.key == pg.K_SPACE:
                 self.toggle_running()
+            elif event.key == pg.K_j:
+                self.worker.advance(self.jump_length)
+            elif event.key == pg.K_t:
+                self.toggle_turbo()
+            elif event.key == pg.K_c:
+                self.toggle_cycle_action()
+            elif event.key == pg.K_e:
+                self.export_pattern()
+            elif event.key == pg.K_s:
+                self.save_checkpoint()
+            elif event.key == pg.K_l:
+                self.load_checkpoint()
+            elif event.key == pg.K_v:
+                self.toggle_recording()
+            elif event.key == pg.K_m:
+                self.toggle_record_source()
+            elif event.key == pg.K_HOME:
+                self.move_camera(self.grid.camera.reset)
+            elif event.key in self.zoom_keys:
+                self.move_camera(self.grid.camera.zoom_at, pg.mouse.get_pos(),
+                                          self.zoom_keys[event.key])
+            elif event.key in self.brush_keys:
+                self.brush.mode = self.brush_keys[event.key]
+                self.set_caption()
+            elif self.turbo and event.key == pg.K_UP:
+                self.generations_per_frame = min(self.max_generations_per_frame,
+                                                              self.generations_per_frame * 2)
+                self.set_caption()
+            elif self.turbo and event.key == pg.K_DOWN:
+                self.generations_per_frame = max(1, self.generations_per_frame // 2)
+                self.set_caption()
             
                 
-        elif event.type == pg.MOUSEBUTTONUP:
-            if not self.running:
-                if self.pattern is None:
-                    for cell in self.grid.grid.values():
-                        if cell.rect.collidepoint(event.pos):
-                            cell.alive = not cell.alive
+        elif event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+            if not self.running and self.pattern is None:
+                if not any(button.rect.collidepoint(event.pos) for button in self.buttons):
+                    index = self.grid.index_at(event.pos)
+                    self.brush.press(index, index in self.worker.snapshot().cells)
+        elif event.type == pg.MOUSEBUTTONDOWN and event.button in (2, 3):
+            self.panning = self.pattern is None
+        elif event.type == pg.MOUSEMOTION:
+            if self.brush.painting:
+                self.brush.drag(self.grid.index_at(event.pos))
+            if self.panning:
+                self.move_camera(self.grid.camera.pan, *event.rel)
+        elif event.type == pg.MOUSEBUTTONUP and event.button == 1:
+            if self.brush.painting:
+                self.brush.release(self.grid.index_at(event.pos))
+        elif event.type == pg.MOUSEBUTTONUP and event.button in (2, 3):
+            self.panning = False
+        elif event.type == pg.MOUSEWHEEL:
+            self.move_camera(self.grid.camera.zoom_at, pg.mouse.get_pos(), event.y)
                 
     def update(self, keys, dt):
+        if self.quit:
+            self.stop_recording(wait=True)
         mouse_pos = pg.mouse.get_pos()
         self.buttons.update(mouse_pos)
         if self.pattern is not None:
-            self.pattern.update(self.grid)
+            self.pattern.update(self.worker)
             if not self.pattern.active:
                 self.pattern = None
-        if keys[pg.K_UP]:
-            self.tick_length = max(self.min_tick_length, self.tick_length - 10)
-            self.set_caption()
-        if keys[pg.K_DOWN]:
-            self.tick_length = min(self.max_tick_length, self.tick_length + 10)
-            self.set_caption()
+        if not self.turbo:
+            if keys[pg.K_UP]:
+                self.tick_length = max(self.min_tick_length, self.tick_length - 10)
+                self.set_caption()
+            if keys[pg.K_DOWN]:
+                self.tick_length = min(self.max_tick_length, self.tick_length + 10)
+                self.set_caption()
+        edits = self.brush.take_edits()
+        if edits:
+            self.worker.set_cells(edits)
         if self.running:
-            self.timer += dt
-            if self.timer > self.tick_length:
-                self.timer -= self.tick_length
-                self.grid.update()
+            if self.turbo:
+                self.worker.request_steps(self.generations_per_frame)
+            else:
+                self.timer += dt
+                if self.timer > self.tick_length:
+                    self.timer -= self.tick_length
+                    self.worker.request_steps(1)
+            self.measure_rate(dt)
+        self.check_cycle()
+                
+    def measure_rate(self, dt):
+        self.rate_timer += dt
+        if self.rate_timer >= 1000:
+            generation = self.worker.snapshot().generation
+            generations = generation - self.rate_mark
+            self.generations_per_second = generations * 1000. / self.rate_timer
+            self.rate_timer = 0
+            self.rate_mark = generation
+            if self.turbo or self.recorder is not None:
+                self.set_caption()
             
         
-    def draw(self, surface):     
+    def get_dirty_rects(self, cells):
+        """
+        Return the screen rects that differ from the last frame: cells that
+        were born, died or changed color, buttons whose image changed, the
+        old and new spots of the pattern preview and brush preview cells.
+        """
+        drawn = self.drawn_cells
+        changed = []
+        if cells is not drawn:
+            changed = [index for index, num in cells.items() if drawn.get(index) != num]
+            changed.extend(index for index in drawn if index not in cells)
+        if self.brush.preview is not self.drawn_preview:
+            changed.extend(self.brush.preview ^ self.drawn_preview)
+        dirty = [self.grid.cell_rect(index) for index in changed]
+        for button in self.buttons:
+            if self.drawn_images.get(button) is not button.image:
+                dirty.append(button.rect)
+        pattern_rect = self.get_pattern_rect()
+        if pattern_rect != self.drawn_pattern:
+            dirty.extend(r for r in (pattern_rect, self.drawn_pattern) if r is not None)
+        return dirty
+        
+    def get_pattern_rect(self):
+        if self.pattern is not None and self.pattern.active:
+            return self.pattern.rect
+        return None
+        
+    def draw_cells(self, surface, cells, indices):
+        if not self.running:
+            color = pg.Color("antiquewhite")
+            for index in indices:
+                if index in cells:
+                    pg.draw.rect(surface, color, self.grid.cell_rect(index))
+        else:
+            for index in indices:
+                if index in cells:
+                    self.grid.draw_cell(surface, index, cells[index])
+                    
+    def draw_preview(self, surface, indices):
+        color = pg.Color("gold")
+        preview = self.brush.preview
+        for index in indices:
+            if index in preview:
+                pg.draw.rect(surface, color, self.grid.cell_rect(index))
+        
+    def draw_all(self, surface, cells):
         surface.fill(pg.Color("black"))
         if not self.running:
-            for cell in [x for x in self.grid.grid.values() if x.alive]:
-                pg.draw.rect(surface, pg.Color("antiquewhite"), cell.rect)
+            if self.snapshot.density is not None:
+                self.grid.draw(surface, self.snapshot)
+            else:
+                self.draw_cells(surface, cells, cells)
+            self.draw_preview(surface, self.brush.preview)
             if self.pattern is not None:
                 self.pattern.draw(surface)
-                          
-            surface.blit(self.grid.overlay, (0, 0))
+            overlay = self.grid.get_overlay(self.snapshot.view)
+            if overlay is not None:
+                surface.blit(overlay, (0, 0))
         else:
-            self.grid.draw(surface)
+            self.grid.draw(surface, self.snapshot)
         self.buttons.draw(surface)
         
-    
\ No newline at end of file
+    def repaint(self, surface, rect, cells):
+        surface.set_clip(rect)
+        surface.fill(pg.Color("black"))
+        indices = list(self.grid.indices_in(rect))
+        self.draw_cells(surface, cells, indices)
+        if not self.running:
+            self.draw_preview(surface, indices)
+            if self.pattern is not None:
+                self.pattern.draw(surface)
+            overlay = self.grid.get_overlay(self.snapshot.view)
+            if overlay is not None:
+                surface.blit(overlay, rect, rect)
+        self.buttons.draw(surface)
+        surface.set_clip(None)
+        
+    def draw(self, surface):
+        """
+        Repaint only what changed since the last frame and return the
+        dirty rects, or redraw everything and return None when the changes
+        are dense, the view changed, the camera is zoomed out or lines are
+        being drawn. Everything is drawn from the worker's latest snapshot,
+        once it shows what the camera is looking at.
+        """
+        self.snapshot = self.worker.snapshot()
+        if self.snapshot.view != self.grid.camera.view:
+            return []
+        zoomed_out = self.snapshot.density is not None
+        lines = self.running and self.grid.draw_mode == "Lines" and not zoomed_out
+        if lines and self.snapshot.edges is None:
+            return []
+        cells = self.snapshot.cells
+        dirty = None
+        if not self.redraw and not zoomed_out:
+            dirty = self.get_dirty_rects(cells)
+            if len(dirty) > self.max_dirty_rects or (lines and dirty):
+                dirty = None
+        if dirty is None:
+            self.draw_all(surface, cells)
+        else:
+            for rect in dirty:
+                self.repaint(surface, rect, cells)
+        self.redraw = False
+        self.drawn_cells = cells
+        self.drawn_images = {button: button.image for button in self.buttons}
+        self.drawn_pattern = self.get_pattern_rect()
+        self.drawn_preview = self.brush.preview
+        self.record_frame(surface)
+        return dirty
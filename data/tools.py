@@ -1,6 +1,8 @@
 import os
 import copy
 import json
+import timeit
+from collections import OrderedDict
 import pygame as pg
 
 
@@ -13,10 +15,14 @@ class Control(object):
         self.fps = 60
         self.dt = 0
         self.show_fps = False
+        self.hud = None
+        self.profile_always = False
+        self.profile_path = "profile-results.json"
         self.keys = pg.key.get_pressed()
         self.state_dict = {}
         self.state_name = None
         self.state = None
+        self.startup = None
 
     def setup_states(self, state_dict, start_state):
         self.state_dict = state_dict
@@ -43,19 +49,58 @@ class Control(object):
                 self.keys = pg.key.get_pressed()
             elif event.type == pg.KEYUP:
                 self.keys = pg.key.get_pressed()
+                if event.key == pg.K_F3:
+                    self.toggle_hud()
             self.state.get_event(event)
 
+    def toggle_hud(self):
+        """
+        Show or hide the profiler HUD. Profiling runs while the HUD is
+        shown, or for the whole run if it was switched on at startup.
+        """
+        if self.hud is None:
+            self.hud = ProfilerHUD(PROFILER, self.screen.get_rect().topright)
+            self.profile_always = PROFILER.enabled
+            PROFILER.enabled = True
+        else:
+            self.hud = None
+            PROFILER.enabled = self.profile_always
+            if hasattr(self.state, "redraw"):
+                self.state.redraw = True
+
     def main(self):
+        frame = None
         while not self.done:
             self.dt = self.clock.tick(self.fps)
+            frame = PROFILER.record("frame", frame) or PROFILER.mark()
+            mark = frame
             self.event_loop()
+            mark = PROFILER.record("events", mark)
             self.update()
-            self.state.draw(self.screen)
-            pg.display.update()
+            mark = PROFILER.record("update", mark)
+            dirty = self.state.draw(self.screen)
+            mark = PROFILER.record("draw", mark)
+            if self.hud is not None:
+                self.hud.update(self.dt)
+                self.hud.draw(self.screen)
+                if dirty is not None:
+                    dirty = list(dirty) + [self.hud.rect]
+            if dirty is None:
+                pg.display.update()
+            else:
+                pg.display.update(dirty)
+            PROFILER.record("flip", mark)
+            if self.startup is not None:
+                self.startup.mark("first frame")
+                print(self.startup.report())
+                self.startup = None
             if self.show_fps:
                 fps = self.clock.get_fps()
                 with_fps = "{} - {:.2f} FPS".format(self.caption, fps)
                 pg.display.set_caption(with_fps)
+        if PROFILER.buffers:
+            PROFILER.export(self.profile_path)
+            print("Profile written to {}".format(self.profile_path))
             
 
 class _State(object):
@@ -80,18 +125,295 @@ class _State(object):
         pass
 
 
+class StartupTimer(object):
+    """Records named checkpoints measured from when the timer was made."""
+    def __init__(self):
+        self.start = timeit.default_timer()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, timeit.default_timer()))
+
+    def report(self):
+        lines = ["Startup:"]
+        last = self.start
+        for name, when in self.marks:
+            lines.append("  {:<12} {:8.1f}ms  (+{:.1f}ms)".format(
+                               name, (when - self.start) * 1000, (when - last) * 1000))
+            last = when
+        return "\n".join(lines)
+
+
+class RingBuffer(object):
+    """Keeps the last size samples added, overwriting the oldest first."""
+    def __init__(self, size):
+        self.samples = [0.0] * size
+        self.size = size
+        self.next = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.next] = value
+        self.next = (self.next + 1) % self.size
+        self.count += 1
+
+    def values(self):
+        """Return the kept samples, oldest first."""
+        if self.count < self.size:
+            return self.samples[:self.count]
+        return self.samples[self.next:] + self.samples[:self.next]
+
+    def percentiles(self, percents=(50, 95, 99)):
+        """Return the nearest-rank percentiles of the kept samples, or None if there are none."""
+        values = sorted(self.values())
+        if not values:
+            return None
+        last = len(values) - 1
+        return [values[min(last, int(round(p / 100.0 * last)))] for p in percents]
+
+
+class Profiler(object):
+    """
+    Times named phases into a RingBuffer each. Callers take a mark before
+    a phase and pass it to record afterwards, which stores the time since
+    the mark and returns a mark for the next phase:
+
+        mark = PROFILER.mark()
+        count()
+        mark = PROFILER.record("neighbors", mark)
+
+    While disabled, mark returns None and record does nothing with it, so
+    instrumented code pays for two calls per phase and nothing more. Each
+    phase should only ever be recorded from one thread.
+    """
+    def __init__(self, size=1024):
+        self.enabled = False
+        self.size = size
+        self.buffers = {}
+        self.clock = timeit.default_timer
+
+    def mark(self):
+        return self.clock() if self.enabled else None
+
+    def record(self, phase, mark):
+        if mark is None or not self.enabled:
+            return None
+        now = self.clock()
+        buffer = self.buffers.get(phase)
+        if buffer is None:
+            buffer = self.buffers[phase] = RingBuffer(self.size)
+        buffer.add(now - mark)
+        return now
+
+    def clear(self):
+        self.buffers = {}
+
+    def stats(self):
+        """Return {phase: summary} in milliseconds over the samples still kept."""
+        stats = {}
+        for phase, buffer in list(self.buffers.items()):
+            values = buffer.values()
+            if not values:
+                continue
+            p50, p95, p99 = buffer.percentiles()
+            stats[phase] = {"samples": buffer.count,
+                                  "mean_ms": sum(values) / len(values) * 1000,
+                                  "p50_ms": p50 * 1000, "p95_ms": p95 * 1000,
+                                  "p99_ms": p99 * 1000, "max_ms": max(values) * 1000}
+        return stats
+
+    def export(self, path):
+        """Write stats and the kept samples of every phase to path as JSON."""
+        samples = {phase: [value * 1000 for value in buffer.values()]
+                       for phase, buffer in list(self.buffers.items())}
+        with open(path, "w") as f:
+            json.dump({"phases": self.stats(), "samples_ms": samples}, f, indent=1)
+
+
+PROFILER = Profiler()
+
+
+class ProfilerHUD(object):
+    """
+    An overlay of the profiler's rolling p50/p95/p99 for each phase above
+    a graph of recent frame times, with a line at the frame budget. The
+    panel is only re-rendered every refresh milliseconds; drawing it
+    between refreshes is one blit.
+    """
+    PHASES = ("frame", "events", "update", "draw", "flip", "step", "neighbors", "rules",
+              "connections", "history", "snapshot")
+
+    def __init__(self, profiler, topright, budget_ms=1000 / 60.0, refresh=250):
+        self.profiler = profiler
+        self.topright = topright
+        self.budget_ms = budget_ms
+        self.refresh = refresh
+        self.elapsed = refresh
+        self.font = pg.font.Font(None, 18)
+        self.width = 260
+        self.graph_height = 60
+        self.image = None
+        self.rect = pg.Rect(0, 0, 0, 0)
+
+    def update(self, dt):
+        self.elapsed += dt
+        if self.elapsed >= self.refresh:
+            self.elapsed = 0
+            self.image = self.render()
+            self.rect = self.image.get_rect(topright=self.topright)
+
+    def render(self):
+        rows = [("ms", "p50", "p95", "p99")]
+        for phase in self.PHASES:
+            buffer = self.profiler.buffers.get(phase)
+            if buffer is not None and buffer.count:
+                rows.append((phase,) + tuple("{:.2f}".format(value * 1000)
+                                                     for value in buffer.percentiles()))
+        line = self.font.get_linesize()
+        text_height = line * len(rows) + 8
+        image = pg.Surface((self.width, text_height + self.graph_height + 8))
+        image.fill((20, 20, 30))
+        columns = (6, 110, 160, 210)
+        for y, row in enumerate(rows):
+            color = (160, 160, 180) if y == 0 else (230, 230, 230)
+            for x, text in zip(columns, row):
+                image.blit(self.font.render(text, True, color), (x, 4 + y * line))
+        self.draw_graph(image, pg.Rect(4, text_height, self.width - 8, self.graph_height))
+        return image
+
+    def draw_graph(self, image, rect):
+        pg.draw.rect(image, (40, 40, 55), rect)
+        buffer = self.profiler.buffers.get("frame")
+        values = buffer.values()[-rect.width:] if buffer is not None else []
+        top_ms = 2 * self.budget_ms
+        for x, value in enumerate(values):
+            ms = value * 1000
+            height = min(rect.height, int(ms / top_ms * rect.height))
+            color = (90, 200, 90) if ms <= self.budget_ms * 1.05 else (220, 80, 60)
+            bottom = rect.bottom - 1
+            pg.draw.line(image, color, (rect.left + x, bottom), (rect.left + x, bottom - height))
+        budget_y = rect.bottom - 1 - int(rect.height / 2)
+        pg.draw.line(image, (200, 200, 90), (rect.left, budget_y), (rect.right - 1, budget_y))
+
+    def draw(self, surface):
+        if self.image is not None:
+            surface.blit(self.image, self.rect)
+
+
+class LRUCache(object):
+    """
+    Holds up to max_size values, dropping the least recently used one
+    when full. get(key, make) returns the cached value or stores make().
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key, make):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            value = make()
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class AssetCache(object):
+    """
+    A read-only mapping of asset names (file names without extension) to
+    assets. Only the directory listing is read up front; each asset is
+    loaded by loader(path) the first time it is looked up.
+    """
+    def __init__(self, directory, loader, accept):
+        self.loader = loader
+        self.paths = {}
+        for filename in os.listdir(directory):
+            name, ext = os.path.splitext(filename)
+            if ext.lower() in accept:
+                self.paths[name] = os.path.join(directory, filename)
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = self.loader(self.paths[name])
+        return self.loaded[name]
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def keys(self):
+        return self.paths.keys()
+
+
+class Atlas(AssetCache):
+    """
+    An AssetCache for small images. The first lookup loads every image in
+    the directory and packs them into rows of one atlas surface; lookups
+    return subsurfaces of the atlas.
+    """
+    def __init__(self, directory, colorkey=(0,0,0), accept=(".png",".jpg",".bmp"),
+                     max_width=1024):
+        super(Atlas, self).__init__(directory, None, accept)
+        self.colorkey = colorkey
+        self.max_width = max_width
+        self.surface = None
+
+    def __getitem__(self, name):
+        if self.surface is None:
+            self.pack()
+        return self.loaded[name]
+
+    def pack(self):
+        images = {name: load_image(path, self.colorkey)
+                       for name, path in self.paths.items()}
+        order = sorted(images, key=lambda name: -images[name].get_height())
+        spots = {}
+        x = y = width = row_height = 0
+        for name in order:
+            w, h = images[name].get_size()
+            if x and x + w > self.max_width:
+                x, y, row_height = 0, y + row_height, 0
+            spots[name] = pg.Rect(x, y, w, h)
+            x += w
+            width = max(width, x)
+            row_height = max(row_height, h)
+        self.surface = pg.Surface((max(width, 1), max(y + row_height, 1))).convert_alpha()
+        self.surface.fill((0,0,0,0))
+        for name, rect in spots.items():
+            self.surface.blit(images[name], rect)
+            self.loaded[name] = self.surface.subsurface(rect)
+
+
+def load_image(path, colorkey=(0,0,0)):
+    img = pg.image.load(path)
+    if img.get_alpha():
+        img = img.convert_alpha()
+    else:
+        img = img.convert()
+        img.set_colorkey(colorkey)
+    return img
+
+
 def load_all_gfx(directory,colorkey=(0,0,0),accept=(".png",".jpg",".bmp")):
     graphics = {}
     for pic in os.listdir(directory):
         name,ext = os.path.splitext(pic)
         if ext.lower() in accept:
-            img = pg.image.load(os.path.join(directory, pic))
-            if img.get_alpha():
-                img = img.convert_alpha()
-            else:
-                img = img.convert()
-                img.set_colorkey(colorkey)
-            graphics[name]=img
+            graphics[name] = load_image(os.path.join(directory, pic), colorkey)
     return graphics
 
 
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+from data.components import checkpoint
+from data.components.grid import AutomataGrid
+
+
+def live_set(grid):
+    return {index for index, _ in grid.live_cells()}
+
+
+@pytest.mark.parametrize("engine, infinite", [("cells", False), ("array", False),
+                                                             ("bitboard", False), ("sparse", True),
+                                                             ("hashlife", True)])
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(tmp_path, engine, infinite, compress):
+    grid = AutomataGrid(300, 200, 4, "High Life", infinite=infinite, engine=engine)
+    grid.randomize()
+    for _ in range(3):
+        grid.update()
+    assert live_set(grid)
+    path = str(tmp_path / "grid.ckpt")
+    checkpoint.capture(grid).write(path, compress)
+    restored = checkpoint.load(path).make_grid()
+    assert restored.engine_name == engine
+    assert restored.generation == grid.generation
+    assert restored.rule == grid.rule
+    assert live_set(restored) == live_set(grid)
+    grid.update()
+    restored.update()
+    assert live_set(restored) == live_set(grid)
+
+
+def test_spread_out_cells_are_saved_as_points(tmp_path):
+    grid = AutomataGrid(300, 200, 4, infinite=True, engine="sparse")
+    rng = random.Random(2)
+    cells = {(rng.randint(-10 ** 6, 10 ** 6), rng.randint(-10 ** 6, 10 ** 6)) for _ in range(50)}
+    grid.set_cells((index, True) for index in cells)
+    saved = checkpoint.capture(grid)
+    assert saved.header["encoding"] == "points"
+    path = str(tmp_path / "points.ckpt")
+    saved.write(path)
+    assert live_set(checkpoint.load(path).make_grid()) == cells
+
+
+def test_restore_into_another_engine(tmp_path):
+    grid = AutomataGrid(300, 200, 4, "B3/S23H", staggered=True, infinite=False,
+                                engine="bitboard")
+    grid.randomize()
+    path = str(tmp_path / "hex.ckpt")
+    checkpoint.capture(grid).write(path)
+    restored = checkpoint.load(path).make_grid(engine="cells")
+    assert restored.staggered
+    assert live_set(restored) == live_set(grid)
+    grid.update()
+    restored.update()
+    assert live_set(restored) == live_set(grid)
+
+
+def test_not_a_checkpoint(tmp_path):
+    path = tmp_path / "junk.ckpt"
+    path.write_bytes(b"not a checkpoint")
+    with pytest.raises(ValueError):
+        checkpoint.load(str(path))
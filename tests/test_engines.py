@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from data.components.grid import AutomataGrid
+
+
+COLUMNS, ROWS = 70, 45
+
+
+def reference_step(grid, live):
+    """One generation of a bounded board, straight from the rule's table."""
+    table = grid.rule.lists()
+    born = set()
+    for column in range(grid.columns):
+        for row in range(grid.rows):
+            num = sum(1 for index in grid.neighbors((column, row)) if index in live)
+            if table[(column, row) in live][num]:
+                born.add((column, row))
+    return born
+
+
+def random_board(grid, seed):
+    rng = np.random.default_rng(seed)
+    cells = rng.random((grid.columns, grid.rows)) < .35
+    grid.load(cells)
+    return set(zip(*map(np.ndarray.tolist, np.nonzero(cells))))
+
+
+def live_set(grid):
+    return {index for index, _ in grid.live_cells()}
+
+
+CASES = [("cells", "Conway", False), ("array", "Conway", False),
+              ("bitboard", "Conway", False), ("bitboard", "B36/S125", False),
+              ("larger", "R1,C0,M0,S2..3,B3..3,NM", False), ("tiled", "Conway", False),
+              ("cells", "Staggered Conway", True), ("array", "B2/S34H", True),
+              ("bitboard", "B2/S34H", True)]
+
+
+@pytest.mark.parametrize("engine, rule, staggered", CASES)
+def test_engine_matches_reference(engine, rule, staggered):
+    grid = AutomataGrid(COLUMNS, ROWS, 1, rule, staggered=staggered, infinite=False,
+                                engine=engine)
+    try:
+        live = random_board(grid, 7)
+        for _ in range(6):
+            live = reference_step(grid, live)
+            grid.update()
+            assert live_set(grid) == live
+    finally:
+        if hasattr(grid.engine, "close"):
+            grid.engine.close()
+
+
+@pytest.mark.parametrize("engine, rule, staggered", [case for case in CASES
+                                                                      if case[0] != "tiled"])
+def test_boxes_match_whole_board(engine, rule, staggered):
+    grid = AutomataGrid(COLUMNS, ROWS, 1, rule, staggered=staggered, infinite=False,
+                                engine=engine)
+    random_board(grid, 8)
+    grid.update()
+    board = grid.engine.cell_array()
+    cells = grid.engine.to_array()
+    for left, top, right, bottom in ((0, 0, COLUMNS, ROWS), (3, 5, 9, 6), (63, 0, 70, 45),
+                                              (1, 1, 66, 44)):
+        box = np.s_[left:right, top:bottom]
+        assert (grid.engine.cell_array_in(left, top, right, bottom) == board[box]).all()
+        assert (grid.engine.to_array_in(left, top, right, bottom) == cells[box]).all()
+
+
+def test_view_array_past_the_edges():
+    grid = AutomataGrid(COLUMNS, ROWS, 1, infinite=False, engine="bitboard")
+    random_board(grid, 9)
+    grid.update()
+    view = -10, -5, 1, 1
+    cells = grid.view_array(view)
+    left, top, right, bottom = grid.camera.box(view, 1)
+    board = grid.engine.cell_array()
+    assert not cells[:-left].any() and not cells[:, :-top].any()
+    width, height = min(right, COLUMNS), min(bottom, ROWS)
+    assert (cells[-left:-left + width, -top:-top + height] == board[:width, :height]).all()
+
+
+def test_sparse_rejects_bounded_grids():
+    with pytest.raises(ValueError):
+        AutomataGrid(100, 100, 10, engine="sparse", infinite=False)
+
+
+def test_birth_on_zero_forces_a_bounded_board():
+    grid = AutomataGrid(100, 100, 10, "B0/S8")
+    assert not grid.infinite
+    grid.update()
+    assert len(grid.live_cells()) == grid.columns * grid.rows
@@ -0,0 +1,89 @@
+import random
+import time
+
+import pygame as pg
+import pytest
+from data import prepare, tools
+from data.states import sim
+from data.components.grid import AutomataGrid
+
+
+SIZE = 160
+
+
+def soup(seed, size=16):
+    """Live cells of a random size x size soup in the middle of a SIZE x SIZE board."""
+    rng = random.Random(seed)
+    start = (SIZE - size) // 2
+    return [(column, row) for column in range(start, start + size)
+               for row in range(start, start + size) if rng.random() < .4]
+
+
+def live_set(grid):
+    return {index for index, _ in grid.live_cells()}
+
+
+@pytest.mark.parametrize("engine", ["hashlife", "sparse"])
+@pytest.mark.parametrize("rule", ["Conway", "B36/S23"])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_advance_matches_array_engine(engine, rule, seed):
+    # The soup can't reach the edges of the array engine's board in the
+    # generations run here, so a bounded board stands in for an infinite one.
+    reference = AutomataGrid(SIZE, SIZE, 1, rule, infinite=False, engine="array")
+    grid = AutomataGrid(SIZE, SIZE, 1, rule, infinite=True, engine=engine)
+    cells = [(index, True) for index in soup(seed)]
+    reference.set_cells(cells)
+    grid.set_cells(cells)
+    for generations in (1, 7, 64, 100):
+        grid.advance(generations)
+        for _ in range(generations):
+            reference.update()
+        assert grid.generation == reference.generation
+        assert live_set(grid) == live_set(reference)
+
+
+def test_sparse_steps_after_a_jump():
+    reference = AutomataGrid(SIZE, SIZE, 1, infinite=False, engine="array")
+    grid = AutomataGrid(SIZE, SIZE, 1, infinite=True, engine="sparse")
+    cells = [(index, True) for index in soup(4)]
+    reference.set_cells(cells)
+    grid.set_cells(cells)
+    grid.advance(50)
+    for _ in range(55):
+        reference.update()
+    for _ in range(5):
+        grid.update()
+    assert live_set(grid) == live_set(reference)
+
+
+def test_bounded_caches_give_the_same_cells():
+    grid = AutomataGrid(SIZE, SIZE, 1, infinite=True, engine="hashlife")
+    small = AutomataGrid(SIZE, SIZE, 1, infinite=True, engine="hashlife")
+    small.engine.max_nodes = small.engine.limit = 2000
+    cells = [(index, True) for index in soup(5)]
+    grid.set_cells(cells)
+    small.set_cells(cells)
+    grid.advance(300)
+    small.advance(300)
+    assert live_set(small) == live_set(grid)
+
+
+@pytest.fixture
+def sim_state():
+    controller = tools.Control(prepare.ORIGINAL_CAPTION)
+    state = sim.Sim()
+    controller.setup_states({"SIM": state}, "SIM")
+    state.startup({"rule": "Conway", "grid": None, "pattern": None})
+    yield state
+    state.cleanup()
+
+
+def test_jump_uses_hashlife(sim_state):
+    worker = sim_state.worker
+    worker.randomize()
+    sim_state.get_event(pg.event.Event(pg.KEYUP, key=pg.K_j, mod=0))
+    deadline = time.time() + 10
+    while worker.snapshot().generation < sim_state.jump_length and time.time() < deadline:
+        time.sleep(.01)
+    assert worker.snapshot().generation == sim_state.jump_length
+    assert sim_state.grid.engine.hashlife is not None
@@ -0,0 +1,50 @@
+import time
+
+import pygame as pg
+import pytest
+from data import prepare, tools
+from data.states import sim, menu, pattern_menu
+
+
+@pytest.fixture
+def control():
+    controller = tools.Control(prepare.ORIGINAL_CAPTION)
+    states = {"SIM": sim.Sim(),
+                  "MENU": menu.Menu(),
+                  "PATTERNMENU": pattern_menu.PatternMenu()}
+    controller.setup_states(states, "MENU")
+    yield controller
+    if controller.state_name == "SIM":
+        controller.state.cleanup()
+
+
+def type_rule(state, text):
+    for char in text:
+        state.get_event(pg.event.Event(pg.KEYDOWN, key=0, unicode=char, mod=0, scancode=0))
+    state.get_event(pg.event.Event(pg.KEYDOWN, key=pg.K_RETURN, unicode="\r", mod=0,
+                                                  scancode=0))
+
+
+@pytest.mark.parametrize("rule, staggered", [("B0/S8", False), ("B01/S2H", True)])
+def test_birth_on_zero_rule_runs_from_menu(control, rule, staggered):
+    type_rule(control.state, rule)
+    assert control.state.done
+    control.update()
+    assert control.state_name == "SIM"
+    grid = control.state.grid
+    assert not grid.infinite and grid.staggered == staggered
+    assert 0 in grid.birth_nums
+    worker = control.state.worker
+    worker.request_steps(2)
+    deadline = time.time() + 5
+    while worker.snapshot().generation < 2 and time.time() < deadline:
+        time.sleep(.01)
+    assert worker.snapshot().generation == 2
+    control.state.draw(control.screen)
+
+
+def test_bad_rule_stays_in_menu(control):
+    type_rule(control.state, "B9/S23")
+    assert not control.state.done
+    assert "neighbors" in control.state.message.text
+
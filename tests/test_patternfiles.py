@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pytest
+from data.components import patternfiles
+from data.components.rules import parse
+
+
+GLIDER_GUN = """#N Gosper glider gun
+x = 36, y = 9, rule = B3/S23
+24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4b
+obo$10bo5bo7bo$11bo3bo$12b2o!
+"""
+
+
+def random_cells(seed, count=3000):
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.integers(-300, 500, count), rng.integers(-50, 900, count)
+    return xs, ys
+
+
+def normalized(xs, ys):
+    return sorted(set(zip((xs - xs.min()).tolist(), (ys - ys.min()).tolist())))
+
+
+def test_read_rle():
+    cells = list(patternfiles.read_rle(io.StringIO(GLIDER_GUN)))
+    assert len(cells) == 36
+    assert (24, 0) in cells and (0, 4) in cells
+
+
+@pytest.mark.parametrize("extension", ["rle", "lif", "mc"])
+def test_round_trip(tmp_path, extension):
+    xs, ys = random_cells(1)
+    path = str(tmp_path / ("pattern." + extension))
+    patternfiles.save(path, xs, ys, "B36/S23", "soup")
+    pattern = patternfiles.PatternFile(path)
+    assert sorted(set(pattern.cells())) == normalized(xs, ys)
+    assert pattern.size == (int(xs.max() - xs.min() + 1), int(ys.max() - ys.min() + 1))
+    if extension != "lif":
+        assert pattern.rule == "B36/S23"
+
+
+def test_matches_whole_rule(tmp_path):
+    path = str(tmp_path / "hex.rle")
+    patternfiles.save(path, np.array([0, 1]), np.array([0, 0]), "B3/S23H")
+    pattern = patternfiles.PatternFile(path)
+    assert pattern.matches(parse("B3/S23H"))
+    assert not pattern.matches(parse("B3/S23"))
+    unnamed = str(tmp_path / "any.lif")
+    patternfiles.save(unnamed, np.array([0]), np.array([0]))
+    assert patternfiles.PatternFile(unnamed).matches(parse("B36/S23"))
@@ -0,0 +1,52 @@
+import pytest
+from data.components.grid import AutomataGrid
+from data.components.rules import LargerRule, Rule, is_staggered, parse
+
+
+@pytest.mark.parametrize("text", ["B36/S23", "b36s23", "B63/S32", "23/36", " B36/S23 "])
+def test_life_like_forms(text):
+    assert parse(text) == Rule((3, 6), (2, 3))
+
+
+def test_hexagonal_rules():
+    assert parse("B2/S34H") == Rule((2,), (3, 4), True)
+    assert parse("Staggered B2/S34") == parse("B2/S34H")
+    assert parse("B2/S34H") != parse("B2/S34")
+    assert is_staggered("B2/S34H") and is_staggered("Staggered Conway")
+    assert not is_staggered("B3/S23") and not is_staggered("nonsense")
+
+
+def test_table_and_string():
+    rule = parse("B3/S23")
+    assert rule.table[0].tolist() == [0, 0, 0, 1, 0, 0, 0, 0, 0]
+    assert rule.table[1].tolist() == [0, 0, 1, 1, 0, 0, 0, 0, 0]
+    assert rule.string == "B3/S23"
+    assert parse(rule.string) == rule
+
+
+def test_larger_than_life():
+    rule = parse("R5,C0,M1,S34..58,B34..45,NM")
+    assert isinstance(rule, LargerRule)
+    assert (rule.radius, rule.neighborhood, rule.middle) == (5, "M", True)
+    assert rule.birth == tuple(range(34, 46)) and rule.survive == tuple(range(34, 59))
+    assert rule.neighbors == 121
+    assert parse(rule.string) == rule
+    assert parse("R2,C0,M0,S,B3..4,NN").neighbors == 12
+
+
+@pytest.mark.parametrize("text", ["B9/S23", "B7/S2H", "Life", "R0,C0,M0,S1..2,B1..2,NM",
+                                              "R1,C3,M0,S1..2,B1..2,NM",
+                                              "R1,C0,M0,S5..2,B1..2,NM",
+                                              "R8,C0,M1,S1..2,B1..2,NM",
+                                              "Staggered R1,C0,M0,S1..2,B1..2,NM"])
+def test_bad_rules(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+def test_compile_named_and_written_rules():
+    assert AutomataGrid.compile_rule("Conway") == parse("B3/S23")
+    assert AutomataGrid.compile_rule("Staggered Conway", True) == parse("B3/S23H")
+    assert AutomataGrid.compile_rule("B3/S23", True) == parse("B3/S23H")
+    with pytest.raises(ValueError):
+        AutomataGrid.compile_rule("B3/S23H")